@@ -0,0 +1,31 @@
+import argparse
+import json
+from services.arena import Arena
+
+def main():
+    parser = argparse.ArgumentParser(description = "Plays engine against engine, without any UI.")
+    parser.add_argument('engine_a', help = 'e.g. "minimax:depth=2" or "heuristic"')
+    parser.add_argument('engine_b', help = 'e.g. "minimax:time_limit_ms=500,depth=None" or "mcts:time_limit_ms=500"')
+    parser.add_argument('-n', '--games', type = int, default = 10, help = 'number of games, colours alternate')
+    parser.add_argument('-w', '--workers', type = int, default = None, help = 'number of processes (default: one per core)')
+    parser.add_argument('-o', '--output', default = 'arena_results.jsonl', help = 'file the results are streamed to')
+    parser.add_argument('-r', '--records', default = None, help = 'directory the games are also recorded to, in binary')
+    parser.add_argument('-t', '--trace', default = None, help = 'file the statistics of every search are appended to')
+    parser.add_argument('-s', '--size', type = int, default = 15, help = 'size of the (square) board')
+    parser.add_argument('--height', type = int, default = None, help = 'number of rows, overrides --size')
+    parser.add_argument('--width', type = int, default = None, help = 'number of columns, overrides --size')
+    args = parser.parse_args()
+    height = args.height or args.size
+    width = args.width or args.size
+
+    arena = Arena(args.engine_a, args.engine_b, args.games, args.workers, height, width)
+
+    def on_result(result):
+        winner = {'a': args.engine_a, 'b': args.engine_b, None: 'draw'}[result['winner_engine']]
+        print(f"game {result['game']}: {winner} ({result['reason']}, {result['move_count']} moves)")
+
+    summary = arena.run(args.output, on_result, args.records, args.trace)
+    print(json.dumps(summary, indent = 2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+from services import benchmark
+
+def main():
+    parser = argparse.ArgumentParser(description = "Times the engine on a fixed set of positions.")
+    parser.add_argument('-p', '--positions', nargs = '*', choices = list(benchmark.POSITIONS), help = 'default: all of them')
+    parser.add_argument('-e', '--entry-points', nargs = '*', choices = list(benchmark.ENTRY_POINTS), help = 'default: all of them')
+    parser.add_argument('-d', '--depth', type = int, default = None, help = 'depth of minimax and computer_move')
+    parser.add_argument('-s', '--sizes', type = int, nargs = '*', default = [15], help = 'board sizes, e.g. 15 19 30')
+    parser.add_argument('-i', '--instrument', action = 'store_true', help = 'collect search statistics (in an extra run)')
+    parser.add_argument('-t', '--trace', default = None, help = 'file the statistics of every search are appended to')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the (slow) peak memory runs')
+    parser.add_argument('-o', '--output', default = 'bench_results.json', help = 'file the results are written to')
+    parser.add_argument('--compare', default = None, help = 'results of an earlier run, regressions make the exit code 1')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed nodes/sec drop against --compare')
+    args = parser.parse_args()
+
+    parameters = {}
+    if args.depth is not None:
+        parameters = {'minimax': args.depth, 'computer_move': args.depth}
+
+    def on_result(result):
+        memory = '' if result['peak_memory_kb'] is None else f"{result['peak_memory_kb']:10.0f} KiB"
+        print(f"{result['size']:>3} {result['position']:<22} {result['entry_point']:<22} {result['nodes']:>8} nodes "
+              f"{result['nodes_per_second']:>12.0f} n/s {result['time_to_move_ms']:>10.1f} ms {memory}")
+        if 'search' in result:
+            search = result['search']
+            print(f"    {search['leaf_evaluations']} leaves, {search['beta_cutoffs']} cutoffs "
+                  f"({search['first_move_cutoff_rate']:.0%} on the first move), TT hit rate {search['tt_hit_rate']:.0%}")
+
+    results = benchmark.run_suite(args.positions, args.entry_points, parameters, not args.no_memory, on_result, args.sizes,
+                                    args.instrument or args.trace is not None, args.trace)
+    benchmark.save(results, args.output)
+
+    if args.compare:
+        regressions = benchmark.compare(results, benchmark.load(args.compare), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + json.dumps(regression))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
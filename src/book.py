@@ -0,0 +1,36 @@
+import argparse
+import os
+from services.arena import Arena
+from services.book import BookBuilder, OpeningBook
+
+def main():
+    parser = argparse.ArgumentParser(description = "Builds or extends the opening book from arena results.")
+    parser.add_argument('results', nargs = '*', help = 'arena results files (JSON lines)')
+    parser.add_argument('-o', '--output', default = 'book.bin', help = 'the book file, extended if it exists')
+    parser.add_argument('-m', '--moves', type = int, default = 10, help = 'number of moves of every game that go into the book')
+    parser.add_argument('--self-play', default = None, help = 'engine that plays itself first, e.g. "minimax:depth=3"')
+    parser.add_argument('-n', '--games', type = int, default = 10, help = 'number of self-play games')
+    parser.add_argument('-w', '--workers', type = int, default = None, help = 'number of self-play processes (default: one per core)')
+    parser.add_argument('-s', '--size', type = int, default = 15, help = 'size of the (square) board')
+    parser.add_argument('--height', type = int, default = None, help = 'number of rows, overrides --size')
+    parser.add_argument('--width', type = int, default = None, help = 'number of columns, overrides --size')
+    args = parser.parse_args()
+    height = args.height or args.size
+    width = args.width or args.size
+
+    results = list(args.results)
+    if args.self_play:
+        path = args.output + '.games.jsonl'
+        Arena(args.self_play, args.self_play, args.games, args.workers, height, width).run(path)
+        results.append(path)
+
+    builder = BookBuilder(height, width, max_moves = args.moves)
+    if os.path.exists(args.output):
+        builder.add_book(args.output)
+    for path in results:
+        print(f"{path}: {builder.add_results(path)} games")
+    builder.save(args.output)
+    print(f"{args.output}: {OpeningBook(args.output).size} entries")
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,503 @@
+import random
 import numpy as np
+from domain.patterns import PLACE_GAIN, BLOCK_LOSS
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+PADDING = 4
+WINDOW_MASK = (1 << (2 * PADDING + 1)) - 1
+
+def _run_through_center(bits):
+    '''
+    Counts the consecutive set bits of a 9-bit line window that pass through the center bit
+    :param bits: the window, bit 4 being the center cell
+    :return: the length of the run through the center, 0 if the center bit is not set
+    '''
+    if not bits >> PADDING & 1:
+        return 0
+    count = 1
+    for step in (1, -1):
+        position = PADDING + step
+        while 0 <= position <= 2 * PADDING and bits >> position & 1:
+            count += 1
+            position += step
+    return count
+
+RUN_LENGTH = [_run_through_center(bits) for bits in range(WINDOW_MASK + 1)]
+
+ZOBRIST_SEED = 0x5EED
+_zobrist_cache = {}
+
+def zobrist_keys(height, width):
+    '''
+    Random 64-bit keys for every (player, cell). They come from a fixed seed, so the same position
+    hashes the same in every process and every run.
+    :return: a list with the keys of player 0 and the keys of player 1, indexed by row * width + col
+    '''
+    key = (height, width)
+    if key not in _zobrist_cache:
+        generator = random.Random(ZOBRIST_SEED ^ (height << 16) ^ width)
+        _zobrist_cache[key] = [[generator.getrandbits(64) for _ in range(height * width)] for _ in range(2)]
+    return _zobrist_cache[key]
+
+# xor-ed into the hash to tell apart the same stones with a different player to move
+SIDE_KEYS = (0, random.Random(ZOBRIST_SEED).getrandbits(64))
+
+# the symmetries of the board: the first 4 keep its shape, the last 4 swap rows and columns (square boards only)
+SYMMETRIES = 8
+INVERSE_SYMMETRY = (0, 1, 2, 3, 4, 5, 7, 6)
+
+def transform(symmetry, row, col, height, width):
+    '''
+    Maps a cell through one of the symmetries of the board: identity, rotation by 180 degrees, the two mirrors,
+    the two diagonal mirrors and the rotations by 90 and 270 degrees
+    :return: the row and column of the cell
+    '''
+    last_row, last_col = height - 1, width - 1
+    if symmetry == 0:
+        return row, col
+    elif symmetry == 1:
+        return last_row - row, last_col - col
+    elif symmetry == 2:
+        return last_row - row, col
+    elif symmetry == 3:
+        return row, last_col - col
+    elif symmetry == 4:
+        return col, row
+    elif symmetry == 5:
+        return last_col - col, last_row - row
+    elif symmetry == 6:
+        return col, last_row - row
+    return last_col - col, row
+
+_geometry_cache = {}
+
+def _line_geometry(height, width):
+    '''
+    Maps every cell to the line it belongs to in each of the four directions.
+    Positions inside a line are shifted by PADDING, and the padding cells (plus everything
+    past the end of the line) are marked as walls, so a 9-cell window can always be cut
+    around a cell without any bounds checks.
+    :return: (line index per direction, wall masks per direction)
+    '''
+    key = (height, width)
+    if key in _geometry_cache:
+        return _geometry_cache[key]
+
+    line_index = []
+    walls = []
+    for row_step, col_step in DIRECTIONS:
+        ids = {}
+        lengths = []
+        index = [None] * (height * width)
+        for row in range(height):
+            for col in range(width):
+                # walk back to the first cell of the line
+                back = 0
+                while 0 <= row - (back + 1) * row_step < height and 0 <= col - (back + 1) * col_step < width:
+                    back += 1
+                start = (row - back * row_step, col - back * col_step)
+                if start not in ids:
+                    ids[start] = len(lengths)
+                    length = 0
+                    while 0 <= start[0] + length * row_step < height and 0 <= start[1] + length * col_step < width:
+                        length += 1
+                    lengths.append(length)
+                index[row * width + col] = (ids[start], back + PADDING)
+        line_index.append(index)
+        full = (1 << (2 * PADDING + max(lengths))) - 1
+        walls.append([full & ~(((1 << length) - 1) << PADDING) for length in lengths])
+
+    _geometry_cache[key] = (line_index, walls)
+    return line_index, walls
+
+_neighbors_cache = {}
+
+def _neighbors(height, width):
+    '''
+    :return: for every cell (row * width + col), the indices of the cells of its 3x3 neighbourhood, itself excluded
+    '''
+    key = (height, width)
+    if key not in _neighbors_cache:
+        _neighbors_cache[key] = [
+            [
+                ni * width + nj
+                for ni in range(max(0, i - 1), min(height, i + 2))
+                for nj in range(max(0, j - 1), min(width, j + 2))
+                if (ni, nj) != (i, j)
+            ]
+            for i in range(height) for j in range(width)
+        ]
+    return _neighbors_cache[key]
 
 class Board:
+    '''
+    The board keeps every player's stones as a Python big-int bitmask (one bit per cell, with a
+    guard column at the end of each row so shifted masks never wrap around) and as small bitmasks
+    for every row, column and diagonal. The NumPy array is only built when somebody asks for it
+    (the GUI and the CLI), the search works on the masks.
+
+    The moves are kept on a stack, a list of height * width entries allocated once: make_move pushes,
+    unmake_move pops and takes the stone back, and everything derived from the stones (the last move,
+    the hash, the candidates and the scores) is back to what it was before the move. The entries above
+    the top stay until another move overwrites them, so undone moves can be redone.
+    '''
     def __init__(self, height = 15, width = 15):
         self.HEIGHT = height
         self.WIDTH = width
-        self.__board = np.full((self.HEIGHT, self.WIDTH), -1, dtype = int)
+        self.STRIDE = width + 1
+        self.__cells = [-1] * (height * width)
+        self.__stones = [0, 0]
+        self.__move_count = 0
         self.__last_move = None
-    
+        self.__view = None
+        self.__hash = 0
+        self.__keys = zobrist_keys(height, width)
+        self.__line_index, self.__walls = _line_geometry(height, width)
+        self.__lines = [[[0] * len(walls) for walls in self.__walls] for _ in range(2)]
+        self.__neighbors = _neighbors(height, width)
+        # number of stones around every cell, and the empty cells that have at least one
+        self.__nearby = [0] * (height * width)
+        self.__candidates = set()
+        # pattern score of every player, the sum of the scores of all its lines (see domain.patterns)
+        self.__scores = [0, 0]
+        # the moves, as index << 1 | player: the first __ply are on the board, the ones up to __redo were undone
+        self.__moves = [0] * (height * width)
+        self.__ply = 0
+        self.__redo = 0
+
     @property
     def board(self):
-        return self.__board
-    
+        if self.__view is None:
+            self.__view = np.array(self.__cells, dtype = int).reshape(self.HEIGHT, self.WIDTH)
+        return self.__view
+
     @property
     def last_move(self):
         return self.__last_move
-    
+
     @property
     def height(self):
         return self.HEIGHT
-    
+
     @property
     def width(self):
         return self.WIDTH
-    
+
+    @property
+    def move_count(self):
+        return self.__move_count
+
+    @property
+    def hash(self):
+        '''
+        The Zobrist hash of the stones on the board, kept up to date on every set/clear
+        '''
+        return self.__hash
+
+    @property
+    def history(self):
+        '''
+        The moves on the stack, the oldest first, as (row, col, player)
+        '''
+        width = self.WIDTH
+        return [((entry >> 1) // width, (entry >> 1) % width, entry & 1) for entry in self.__moves[:self.__ply]]
+
+    @property
+    def redo_count(self):
+        '''
+        The number of undone moves that redo_move can play again
+        '''
+        return self.__redo - self.__ply
+
+    @property
+    def candidates(self):
+        '''
+        The empty cells next to at least one stone, as indices row * width + col. Kept up to date on every set/clear,
+        it must not be modified by the caller.
+        '''
+        return self.__candidates
+
+    def ordered_candidates(self, row, col):
+        '''
+        :param row: the row of the reference cell
+        :param col: the column of the reference cell
+        :return: the candidate moves, as (row, col), closest (Manhattan distance) to the reference cell first
+        '''
+        width = self.WIDTH
+        indices = sorted(self.__candidates, key = lambda index: (abs(index // width - row) + abs(index % width - col), index))
+        return [divmod(index, width) for index in indices]
+
+    def score(self, player):
+        '''
+        :param player: the player
+        :return: the pattern score of the player's lines over the whole board, kept up to date on every set/clear
+        '''
+        return self.__scores[player]
+
+    def gain(self, row, col, player):
+        '''
+        How much the player's score would go up with a stone on the (empty) cell, without putting it there.
+        Big for the moves that make fours and open threes, and, as the opponent's gain, for the moves that block them.
+        :param row: the row of the cell
+        :param col: the column of the cell
+        :param player: the player
+        :return: the gain
+        '''
+        index = row * self.WIDTH + col
+        own_lines = self.__lines[player]
+        other_lines = self.__lines[player ^ 1]
+        gain = 0
+        for direction in range(4):
+            line, position = self.__line_index[direction][index]
+            shift = position - PADDING
+            own = own_lines[direction][line] >> shift & WINDOW_MASK
+            other = other_lines[direction][line] >> shift & WINDOW_MASK
+            wall = self.__walls[direction][line] >> shift & WINDOW_MASK
+            gain += PLACE_GAIN[own << 9 | other | wall]
+        return gain
+
+    def canonical_hash(self, player = 0):
+        '''
+        The smallest of the Zobrist hashes of the position under the symmetries of the board, so that
+        all the rotations and reflections of a position share it
+        :param player: the player whose stones are hashed as player 0's (and the opponent's as player 1's),
+                       so that the same stones of the player to move hash the same whatever its colour
+        :return: the hash and the symmetry (see transform) that maps the position onto the one it belongs to
+        '''
+        height, width = self.HEIGHT, self.WIDTH
+        count = SYMMETRIES if height == width else SYMMETRIES // 2
+        hashes = [0] * count
+        for owner in range(2):
+            keys = self.__keys[owner ^ player]
+            mask = self.__stones[owner]
+            while mask:
+                low = mask & -mask
+                mask ^= low
+                row, col = divmod(low.bit_length() - 1, self.STRIDE)
+                for symmetry in range(count):
+                    mapped_row, mapped_col = transform(symmetry, row, col, height, width)
+                    hashes[symmetry] ^= keys[mapped_row * width + mapped_col]
+        symmetry = min(range(count), key = hashes.__getitem__)
+        return hashes[symmetry], symmetry
+
     def element(self, row, col):
-        return self.__board[row, col]
-    
-    def add_move(self, row, col, player):
-        self.__board[row, col] = player
+        return self.__cells[row * self.WIDTH + col]
+
+    def stones(self, player):
+        '''
+        :param player: the player
+        :return: the bitmask of the player's stones, bit row * STRIDE + col being set for every stone
+        '''
+        return self.__stones[player]
+
+    def set(self, row, col, player):
+        '''
+        Puts a stone on the board, in O(1), without it being a move (see make_move)
+        :param row: the row of the stone
+        :param col: the column of the stone
+        :param player: the player the stone belongs to
+        '''
+        index = row * self.WIDTH + col
+        if self.__cells[index] != -1:
+            self.clear(row, col)
+        self.__cells[index] = player
+        self.__stones[player] |= 1 << (row * self.STRIDE + col)
+        self.__hash ^= self.__keys[player][index]
+        own_lines = self.__lines[player]
+        other_lines = self.__lines[player ^ 1]
+        gain = loss = 0
+        for direction in range(4):
+            line, position = self.__line_index[direction][index]
+            shift = position - PADDING
+            own = own_lines[direction][line] >> shift & WINDOW_MASK
+            other = other_lines[direction][line] >> shift & WINDOW_MASK
+            wall = self.__walls[direction][line] >> shift & WINDOW_MASK
+            gain += PLACE_GAIN[own << 9 | other | wall]
+            loss += BLOCK_LOSS[other << 9 | own | wall]
+            own_lines[direction][line] |= 1 << position
+        self.__scores[player] += gain
+        self.__scores[player ^ 1] -= loss
+        nearby = self.__nearby
+        candidates = self.__candidates
+        candidates.discard(index)
+        for neighbor in self.__neighbors[index]:
+            nearby[neighbor] += 1
+            if nearby[neighbor] == 1 and self.__cells[neighbor] == -1:
+                candidates.add(neighbor)
+        self.__move_count += 1
+        self.__view = None
+
+    def clear(self, row, col):
+        '''
+        Takes a stone off the board, in O(1), leaving the move stack as it is (see unmake_move)
+        :param row: the row of the stone
+        :param col: the column of the stone
+        '''
+        index = row * self.WIDTH + col
+        player = self.__cells[index]
+        if player == -1:
+            return
+        self.__cells[index] = -1
+        self.__stones[player] &= ~(1 << (row * self.STRIDE + col))
+        self.__hash ^= self.__keys[player][index]
+        own_lines = self.__lines[player]
+        other_lines = self.__lines[player ^ 1]
+        gain = loss = 0
+        for direction in range(4):
+            line, position = self.__line_index[direction][index]
+            own_lines[direction][line] &= ~(1 << position)
+            shift = position - PADDING
+            own = own_lines[direction][line] >> shift & WINDOW_MASK
+            other = other_lines[direction][line] >> shift & WINDOW_MASK
+            wall = self.__walls[direction][line] >> shift & WINDOW_MASK
+            gain += PLACE_GAIN[own << 9 | other | wall]
+            loss += BLOCK_LOSS[other << 9 | own | wall]
+        self.__scores[player] -= gain
+        self.__scores[player ^ 1] += loss
+        nearby = self.__nearby
+        candidates = self.__candidates
+        for neighbor in self.__neighbors[index]:
+            nearby[neighbor] -= 1
+            if nearby[neighbor] == 0:
+                candidates.discard(neighbor)
+        if nearby[index]:
+            candidates.add(index)
+        self.__move_count -= 1
+        self.__view = None
+
+    def window(self, row, col, direction):
+        '''
+        Extracts the 9 cells centered on (row, col) along one of the DIRECTIONS.
+        Bit 4 of every mask is the cell itself, cells outside the board are walls.
+        :param row: the row of the center cell
+        :param col: the column of the center cell
+        :param direction: the index of the direction in DIRECTIONS
+        :return: (stones of player 0, stones of player 1, walls) as 9-bit masks
+        '''
+        line, position = self.__line_index[direction][row * self.WIDTH + col]
+        shift = position - PADDING
+        return (
+            self.__lines[0][direction][line] >> shift & WINDOW_MASK,
+            self.__lines[1][direction][line] >> shift & WINDOW_MASK,
+            self.__walls[direction][line] >> shift & WINDOW_MASK
+        )
+
+    def count_line(self, row, col, direction, player):
+        '''
+        Counts the consecutive stones of the player through (row, col), along one of the DIRECTIONS.
+        Only the 4 cells on each side are looked at, which is all a five needs.
+        :param row: the row of the cell
+        :param col: the column of the cell
+        :param direction: the index of the direction in DIRECTIONS
+        :param player: the player
+        :return: the length of the run, 0 if the cell does not belong to the player
+        '''
+        line, position = self.__line_index[direction][row * self.WIDTH + col]
+        return RUN_LENGTH[self.__lines[player][direction][line] >> (position - PADDING) & WINDOW_MASK]
+
+    def has_five(self, player):
+        '''
+        Checks the whole board for five in a row, with a handful of shifts on the bitmask
+        :param player: the player
+        :return: True if the player has at least 5 consecutive stones, False otherwise
+        '''
+        stones = self.__stones[player]
+        for shift in (1, self.STRIDE, self.STRIDE + 1, self.STRIDE - 1):
+            pairs = stones & (stones >> shift)
+            fours = pairs & (pairs >> 2 * shift)
+            if fours & (stones >> 4 * shift):
+                return True
+        return False
+
+    def occupied(self):
+        '''
+        :return: the stones on the board, as a list of (row, col, player)
+        '''
+        width = self.WIDTH
+        return [(index // width, index % width, player) for index, player in enumerate(self.__cells) if player != -1]
+
+    def copy(self):
+        '''
+        :return: a new board with the same stones and the same moves
+        '''
+        board = Board(self.HEIGHT, self.WIDTH)
+        board.__setstate__(self.__getstate__())
+        return board
+
+    def __getstate__(self):
+        # only the stones and the moves travel (e.g. to worker processes), everything else is rebuilt from them
+        return {'height': self.HEIGHT, 'width': self.WIDTH, 'stones': self.occupied(), 'moves': self.history}
+
+    def __setstate__(self, state):
+        self.__init__(state['height'], state['width'])
+        moves = {(row, col) for row, col, _ in state['moves']}
+        for row, col, player in state['stones']:
+            if (row, col) not in moves:
+                self.set(row, col, player)
+        for row, col, player in state['moves']:
+            self.make_move(row, col, player)
+
+    def make_move(self, row, col, player):
+        '''
+        Puts the stone of the player on the board and pushes the move, in O(1). The moves undone before are dropped.
+        '''
+        index = row * self.WIDTH + col
+        if self.__cells[index] != -1:
+            self.remove_move(row, col)
+        self.set(row, col, player)
+        self.__moves[self.__ply] = index << 1 | player
+        self.__ply += 1
+        self.__redo = self.__ply
         self.__last_move = (row, col)
 
+    def unmake_move(self):
+        '''
+        Takes back the last move, in O(1)
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        if self.__ply == 0:
+            return None
+        self.__ply -= 1
+        entry = self.__moves[self.__ply]
+        row, col = divmod(entry >> 1, self.WIDTH)
+        self.clear(row, col)
+        self.__last_move = divmod(self.__moves[self.__ply - 1] >> 1, self.WIDTH) if self.__ply else None
+        return row, col, entry & 1
+
+    def redo_move(self):
+        '''
+        Plays again the last move taken back, in O(1)
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        if self.__ply == self.__redo:
+            return None
+        entry = self.__moves[self.__ply]
+        row, col = divmod(entry >> 1, self.WIDTH)
+        self.set(row, col, entry & 1)
+        self.__ply += 1
+        self.__last_move = (row, col)
+        return row, col, entry & 1
+
+    def add_move(self, row, col, player):
+        self.make_move(row, col, player)
+
     def add_temp_move(self, row, col, player):
-        self.__board[row, col] = player
-        
+        self.make_move(row, col, player)
+
     def remove_move(self, row, col):
-        self.__board[row, col] = -1
\ No newline at end of file
+        '''
+        Takes a stone off the board: the last move is unmade, any other move is taken out of the stack
+        '''
+        index = row * self.WIDTH + col
+        ply = self.__ply
+        if ply and self.__moves[ply - 1] >> 1 == index:
+            self.unmake_move()
+            return
+        self.clear(row, col)
+        moves = self.__moves
+        for position in range(ply):
+            if moves[position] >> 1 == index:
+                moves[position:ply - 1] = moves[position + 1:ply]
+                self.__ply = self.__redo = ply - 1
+                self.__last_move = divmod(moves[ply - 2] >> 1, self.WIDTH) if ply > 1 else None
+                break
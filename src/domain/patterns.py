@@ -0,0 +1,55 @@
+'''
+Pattern tables for the evaluation.
+
+A line is scored window by window: every 5 consecutive cells that hold no opponent stone (and no wall)
+are worth WINDOW_SCORES[number of own stones in them]. That is how the threats come out of the sum:
+a five is worth FIVE, an open four _XXXX_ fills two four-windows, a closed four only one, an open
+three _XXX_ fills three three-windows, and so on.
+
+A stone only changes the 5 windows that contain it, i.e. the 9 cells centered on it. The tables below
+are indexed by those 9 cells, encoded as two 9-bit masks (own stones << 9 | opponent stones and walls,
+with the center bit clear), so the change of a move is a couple of lookups per direction.
+'''
+
+FIVE = 1000000
+FOUR = 5000
+THREE = 200
+TWO = 10
+ONE = 1
+
+WINDOW_SCORES = (0, ONE, TWO, THREE, FOUR, FIVE)
+WINDOW_LENGTH = 5
+CENTER = 1 << 4
+
+def window_score(own, blocked):
+    '''
+    Scores the windows of a 9-cell line segment that contain its center
+    :param own: the 9-bit mask of the player's stones
+    :param blocked: the 9-bit mask of the opponent's stones and the walls
+    :return: the sum of the scores of the 5 windows through the center
+    '''
+    score = 0
+    for start in range(WINDOW_LENGTH):
+        window = ((1 << WINDOW_LENGTH) - 1) << start
+        if not blocked & window:
+            score += WINDOW_SCORES[bin(own & window).count('1')]
+    return score
+
+def _build_tables():
+    place_gain = [0] * (1 << 18)
+    block_loss = [0] * (1 << 18)
+    for own in range(1 << 9):
+        if own & CENTER:
+            continue
+        for blocked in range(1 << 9):
+            if blocked & (own | CENTER):
+                continue
+            index = own << 9 | blocked
+            base = window_score(own, blocked)
+            place_gain[index] = window_score(own | CENTER, blocked) - base
+            block_loss[index] = base - window_score(own, blocked | CENTER)
+    return place_gain, block_loss
+
+# PLACE_GAIN[own << 9 | blocked]: how much the player gains by putting a stone on the (empty) center
+# BLOCK_LOSS[own << 9 | blocked]: how much the player loses when the opponent puts a stone on the center
+PLACE_GAIN, BLOCK_LOSS = _build_tables()
@@ -1,13 +1,25 @@
+import argparse
 from ui.ui import UI
 from ui.gui import GUI
 
 def main():
-    
-    #ui = UI()
-    #ui.run()
-    
-    gui = GUI()
-    gui.run()
+    parser = argparse.ArgumentParser(description = "Gomoku.")
+    parser.add_argument('-s', '--size', type = int, default = 15, help = 'size of the (square) board')
+    parser.add_argument('--height', type = int, default = None, help = 'number of rows, overrides --size')
+    parser.add_argument('--width', type = int, default = None, help = 'number of columns, overrides --size')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--gui', action = 'store_true', help = 'play in the window (the default)')
+    mode.add_argument('--cli', action = 'store_true', help = 'play in the console instead of the window')
+    args = parser.parse_args()
+    height = args.height or args.size
+    width = args.width or args.size
+
+    if args.cli:
+        ui = UI(height, width)
+        ui.run()
+    else:
+        gui = GUI(height, width)
+        gui.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,15 @@
+import argparse
+from services.protocol import PiskvorkEngine
+
+def main():
+    '''
+    The engine for Piskvork and the other Gomocup tournament managers, speaking the protocol on stdin/stdout
+    '''
+    parser = argparse.ArgumentParser(description = "Gomocup brain, speaking the Piskvork protocol on stdin/stdout.")
+    parser.add_argument('--ponder', action = 'store_true', help = "think on the opponent's time")
+    args = parser.parse_args()
+    engine = PiskvorkEngine(args.ponder)
+    engine.run()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,95 @@
+import time
 import numpy as np
-from domain.board import Board
+from domain.board import Board, SIDE_KEYS
+from domain.patterns import FIVE, THREE
+from services.transposition import TranspositionTable
+from services.parallel import ParallelSearch
+from services.threats import ThreatSearch
+from services.background import BackgroundSearch
 
 class AI:
-    def __init__(self):
-        self.__board = Board()
+    def __init__(self, tt_memory_mb = 16, board = None, book = None, cache = None, height = 15, width = 15):
+        self.__board = board if board is not None else Board(height, width)
+        self.__book = book # a services.book.OpeningBook, asked before every search
+        self.__cache = cache # a services.eval_cache.EvaluationCache, shared with other processes and runs
+        self.__transpositions = TranspositionTable(tt_memory_mb)
+        self.__tt_memory_mb = tt_memory_mb
+        self.__parallel = None
+        self.__nodes = 0
+        self.__deadline = None
+        self.__next_check = 0
+        self.__stopped = False
+        self.__completed_depth = 0
+        self.__principal_variation = []
+        self.__stats = None
+        # pondering: the background search, and the moves it found, by the hash of the position they are for
+        self.__ponder = None
+        self.__ponder_stopped = False
+        self.__pondered = {}
+        self.__ponder_hit = False
+        self.__timed_depth = None # the depth the last search with a time limit got to
+        # move ordering: two killer moves per ply, and a history score per player and cell
+        self.__killers = [[None, None] for _ in range(self.__board.height * self.__board.width + 1)]
+        self.__history = [[0] * (self.__board.height * self.__board.width) for _ in range(2)]
         self.__game_over = False
         self.max_depth = 3
-        self.board_height = 15
-        self.board_width = 15
+        self.board_height = self.__board.height
+        self.board_width = self.__board.width
         self.__player = 0
         self.COMPUTER = 1
         self.PLAYER = 0
         self.EMPTY = -1
+        self.CHECK_INTERVAL = 64 # nodes between two looks at the clock
+        self.WIN = 10 * FIVE # above any evaluation, a win found closer to the root scores a bit more
+        self.ASPIRATION_WINDOW = 2 * THREE # about one open three either way
+        self.KILLER_BONUS = THREE # a killer goes before the quiet moves, after the threats
+        self.CACHE_DEPTH = 2 # the evaluation cache only holds the nodes searched at least this deep
 
     @property
     def board(self):
         return self.__board.board
 
+    @property
+    def last_move(self):
+        return self.__board.last_move
+
+    def board_copy(self):
+        '''
+        :return: a copy of the board the AI plays on
+        '''
+        return self.__board.copy()
+
+    @property
+    def transposition_table(self):
+        return self.__transpositions
+
+    @property
+    def evaluation_cache(self):
+        return self.__cache
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def completed_depth(self):
+        return self.__completed_depth
+
+    @property
+    def principal_variation(self):
+        return self.__principal_variation
+
+    @property
+    def pondering(self):
+        return self.__ponder is not None and not self.__ponder.done
+
+    @property
+    def ponder_hit(self):
+        '''
+        True if the last computer_move was answered from pondering, without a search
+        '''
+        return self.__ponder_hit
+
     @property
     def game_over(self):
         return self.__game_over
@@ -35,6 +108,17 @@ class AI:
         '''
         self.__player = self.__player ^ 1
     
+    def instrument(self, stats):
+        '''
+        Attaches search statistics to the AI, or takes them off
+        :param stats: a services.instrumentation.SearchStats, None for none (the search then pays nothing for them)
+        '''
+        if self.__stats is not None:
+            self.__stats.detach()
+        self.__stats = stats
+        if stats is not None:
+            stats.attach(self)
+
     def is_valid_move(self, row, col):
         '''
         Checks if the move is valid
@@ -49,27 +133,80 @@ class AI:
         Checks if the board is full
         :return: True if the board is full, False otherwise
         '''
-        return all(self.__board.element(i, j) != self.EMPTY for i in range(self.board_height) for j in range(self.board_width))
+        return self.__board.move_count == self.board_height * self.board_width
     
     def generate_moves(self):
         '''
         Generates all the possible moves. For efficiency purposes, I only generate the moves around active cells.
+        The board keeps that set of cells up to date on every move, so nothing is scanned and no move comes twice.
         Also, I sort the moves by the distance from the last move.
         :return: a list of possible moves
         '''
-        moves = []
-        for i in range(self.board_height):
-            for j in range(self.board_width):
-                if self.__board.element(i, j) != self.EMPTY:
-                    for ni, nj in self.get_neighbors(i, j):
-                        if self.__board.element(ni, nj) == self.EMPTY:
-                            moves.append((ni, nj))
-                            
+        if self.__board.move_count == 0:
+            return [(self.board_height // 2, self.board_width // 2)]
+
         most_recent_move = self.__board.last_move
-        moves.sort(key=lambda move: abs(move[0] - most_recent_move[0]) + abs(move[1] - most_recent_move[1]))
+        if most_recent_move is None:
+            most_recent_move = (self.board_height // 2, self.board_width // 2)
 
-        return moves
+        return self.__board.ordered_candidates(most_recent_move[0], most_recent_move[1])
     
+    def order_moves(self, moves, player, ply = 0, tt_move = None):
+        '''
+        Sorts the moves for the search, best first: the move from the transposition table, then by the sum of
+        - how much the move gains the player and the opponent (making and blocking fours and open threes),
+        - KILLER_BONUS if it caused a beta cutoff in a sibling position (the killer moves of the ply),
+        - its history score (how often and how deep it caused beta cutoffs).
+        Moves with the same score keep their order (closest to the last move first).
+        :param moves: the moves, as (row, col)
+        :param player: the player to move
+        :param ply: the distance from the root of the search
+        :param tt_move: the best move stored for the position, None if there is none
+        :return: the sorted list of moves
+        '''
+        board = self.__board
+        width = board.width
+        history = self.__history[player]
+        killers = self.__killers[ply] if ply < len(self.__killers) else (None, None)
+
+        def priority(move):
+            row, col = move
+            score = board.gain(row, col, player) + board.gain(row, col, player ^ 1) + history[row * width + col]
+            if move == killers[0] or move == killers[1]:
+                score += self.KILLER_BONUS
+            return score
+
+        ordered = sorted(moves, key = priority, reverse = True)
+        if tt_move is not None and tt_move in moves:
+            ordered.remove(tt_move)
+            ordered.insert(0, tt_move)
+        return ordered
+
+    def record_cutoff(self, move, player, depth, ply, index = 0):
+        '''
+        Remembers a move that caused a beta cutoff, as a killer of its ply and in the history table
+        :param move: the move
+        :param player: the player who made it
+        :param depth: the remaining depth of the search at that node (deeper cutoffs count more)
+        :param ply: the distance from the root of the search
+        :param index: the place of the move in the ordered moves (only counted by services.instrumentation)
+        '''
+        self.__history[player][move[0] * self.__board.width + move[1]] += depth * depth
+        if ply < len(self.__killers):
+            killers = self.__killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+
+    def age_history(self):
+        '''
+        Halves the history scores, so that the cutoffs of earlier searches weigh less than the new ones
+        '''
+        for history in self.__history:
+            for index, value in enumerate(history):
+                if value:
+                    history[index] = value >> 1
+
     def get_neighbors(self, i, j):
         '''
         Gets the neighbors of a cell.
@@ -91,132 +228,410 @@ class AI:
         :param purpose: the purpose of the check
         :return: True if the player has won the game, False otherwise
         '''
-        for i in range(self.board_height):
-            for j in range(self.board_width):
-                if (
-                    j + 4 < self.board_width and all(self.__board.element(i, j + k) == player for k in range(5)) or
-                    i + 4 < self.board_height and all(self.__board.element(i + k, j) == player for k in range(5)) or
-                    i + 4 < self.board_height and j + 4 < self.board_width and all(self.__board.element(i + k, j + k) == player for k in range(5)) or
-                    i - 4 >= 0 and j + 4 < self.board_width and all(self.__board.element(i - k, j + k) == player for k in range(5))
-                ):
-                    if purpose == None:
-                        self.__game_over = True
-                    return True
+        if self.__board.has_five(player):
+            if purpose == None:
+                self.__game_over = True
+            return True
+        return False
+
+    def is_winning_move(self, row, col, player):
+        '''
+        Checks if the stone at (row, col) completes five in a row for the player.
+        Only the four lines through that stone are looked at, so this is O(1) instead of a board scan.
+        :param row: the row of the stone just placed
+        :param col: the column of the stone just placed
+        :param player: the player the stone belongs to
+        :return: True if the stone makes five in a row, False otherwise
+        '''
+        for direction in range(4):
+            if self.__board.count_line(row, col, direction, player) >= 5:
+                return True
         return False
 
-    def computer_move(self, depth = 4):
+    def computer_move(self, depth = 4, time_limit_ms = None):
+        '''
+        Makes a move for the computer player. The search is deepened one ply at a time and the best move
+        of the deepest completed iteration is returned. Each iteration starts from the principal variation
+        of the previous one, which the transposition table hands back as the best move of every node on it.
+        If the time budget runs out (or stop() is called) in the middle of an iteration, that iteration is dropped.
+        A position that is in the opening book is not searched at all, nor is one that ponder searched deep enough.
+        :param depth: the maximum depth of the search, None for no limit (then a time limit should be given)
+        :param time_limit_ms: the time budget in milliseconds, None to always search to the full depth
+        :return: the row and column of the move
+        '''
+        self.stop_pondering()
+        self.__transpositions.new_search()
+        self.age_history()
+        self.__ponder_hit = False
+        self.__nodes = 0
+        self.__stopped = False
+        self.__completed_depth = 0
+        self.__principal_variation = []
+        if self.__book is not None:
+            move = self.__book.move(self.__board, player = self.COMPUTER)
+            if move is not None:
+                return move
+        pondered = self.__pondered.get(self.__board.hash)
+        # with a time limit, deep enough is as deep as the last search with a time limit went
+        required = depth if depth is not None or time_limit_ms is None else self.__timed_depth
+        if pondered is not None and required is not None and pondered[0] >= required:
+            # the position was searched deep enough while the opponent was thinking
+            self.__ponder_hit = True
+            self.__completed_depth = pondered[0]
+            self.__principal_variation = self.extract_principal_variation(pondered[0])
+            return pondered[1]
+        if time_limit_ms is not None:
+            self.__deadline = time.perf_counter() + time_limit_ms / 1000
+            self.__next_check = 0
+
+        empty_cells = self.board_height * self.board_width - self.__board.move_count
+        max_depth = empty_cells if depth is None else min(depth, empty_cells)
+        best_move = None
+        score = None
+
+        for current_depth in range(1, max_depth + 1):
+            result, move = self.aspiration_search(current_depth, score)
+            if self.__stopped:
+                if best_move is None:
+                    best_move = move
+                break
+            best_move, score = move, result
+            self.__completed_depth = current_depth
+            self.__principal_variation = self.extract_principal_variation(current_depth)
+            if abs(score) >= self.WIN:
+                # a forced win (or loss) was found, searching deeper will not change it
+                break
+
+        self.__deadline = None
+        if time_limit_ms is not None:
+            self.__timed_depth = self.__completed_depth
+
+        if best_move:
+            row, col = best_move
+            return row, col
+
+    def aspiration_search(self, depth, previous_score = None):
+        '''
+        Searches the root with a narrow window around the score of the previous iteration,
+        and again with the full window if the score falls outside of it
+        :param depth: the depth of the search
+        :param previous_score: the score of the previous iteration, None to search with the full window
+        :return: the score and the best move of the computer
+        '''
+        last_move = self.__board.last_move
+        if previous_score is not None and depth > 2 and abs(previous_score) < self.WIN:
+            alpha = previous_score - self.ASPIRATION_WINDOW
+            beta = previous_score + self.ASPIRATION_WINDOW
+            score, move = self.negamax(depth, self.COMPUTER, alpha, beta, last_move)
+            if self.__stopped or alpha < score < beta:
+                return score, move
+        return self.negamax(depth, self.COMPUTER, float('-inf'), float('inf'), last_move)
+
+    def parallel_move(self, depth = 4, workers = None):
         '''
-        Makes a move for the computer player.
+        Makes a move for the computer player, splitting the root moves over worker processes.
+        It returns the same move as minimax to the same depth, only faster on a machine with many cores.
         :param depth: the depth of the search
+        :param workers: the number of worker processes, None for one per core
         :return: the row and column of the move
         '''
-        _, best_move = self.minimax(depth, self.COMPUTER, float('-inf'), float('inf'), True)
-        
+        if self.__parallel is not None and workers is not None and workers != self.__parallel.workers:
+            self.close()
+        if self.__parallel is None:
+            self.__parallel = ParallelSearch(workers, self.__tt_memory_mb, self.__cache.path if self.__cache is not None else None)
+
+        _, best_move = self.__parallel.search(self.__board, self.root_moves(), depth)
+        self.__nodes = self.__parallel.nodes
+
         if best_move:
             row, col = best_move
             return row, col
 
-    def minimax(self, depth, player, alpha, beta, maximize=True):
+    def root_moves(self):
+        '''
+        :return: the computer's moves in the order the root of the serial search tries them (see negamax),
+                 with the killers, the history and the transposition table as they are now
+        '''
+        entry = self.__transpositions.probe(self.__board.hash ^ SIDE_KEYS[self.COMPUTER])
+        tt_move = entry[3] if entry is not None else None
+        return self.order_moves(self.generate_moves(), self.COMPUTER, 0, tt_move)
+
+    def search_root_moves(self, moves, depth):
         '''
-        The minimax algorithm, with alpha-beta pruning.
+        Searches some of the computer's moves from the current position, in the given order,
+        exactly as the root of minimax would (see ParallelSearch)
+        :param moves: the moves to search
+        :param depth: the depth of the search
+        :return: the best score and the first move that reaches it
+        '''
+        self.__nodes = 0
+        alpha = float('-inf')
+        best_eval = float('-inf')
+        best_move = None
+
+        for move in moves:
+            row, col = move
+            self.__board.make_move(row, col, self.COMPUTER)
+            eval = self.minimax(depth - 1, self.PLAYER, alpha, float('inf'), maximize = False, last_move = move)[0]
+            self.__board.unmake_move()
+
+            if eval > best_eval:
+                best_eval = eval
+                best_move = move
+            alpha = max(alpha, best_eval)
+
+        return best_eval, best_move
+
+    def close(self):
+        '''
+        Stops the pondering and the worker processes of the parallel search, if there are any
+        '''
+        self.stop_pondering()
+        if self.__parallel is not None:
+            self.__parallel.shutdown()
+            self.__parallel = None
+
+    def stop(self):
+        '''
+        Asks the running search to stop, it returns the best move of the deepest completed iteration
+        '''
+        self.__stopped = True
+
+    def ponder(self, replies = 1, max_depth = None):
+        '''
+        Thinks on the opponent's time: searches, in a background thread, the positions after the replies the
+        opponent is most likely to play, a little deeper every round until stop_pondering (or computer_move).
+        The search runs on a copy of the board, so the board can be read and played on meanwhile, but it shares
+        the transposition table: after a predicted reply (a ponder hit) computer_move returns the move found
+        for it at once, after any other move the search still finds the entries of the positions they share.
+        To be called once the AI has moved, with the opponent to move.
+        :param replies: the number of replies searched, the one of the principal variation first, then the best by move ordering
+        :param max_depth: the deepest search of a reply, None for no limit
+        '''
+        self.stop_pondering()
+        self.__pondered = {}
+        predicted = self.predicted_replies(replies)
+        if not predicted:
+            return
+        ponderer = AI(1, self.__board.copy(), cache = self.__cache)
+        # the work goes into this AI's table
+        ponderer.__transpositions = self.__transpositions
+        self.__ponder_stopped = False
+        def stop():
+            self.__ponder_stopped = True
+            ponderer.stop()
+        self.__ponder = BackgroundSearch(lambda: self.__ponder_search(ponderer, predicted, max_depth), stop)
+
+    def __ponder_search(self, ponderer, replies, max_depth):
+        board = ponderer.__board
+        empty_cells = self.board_height * self.board_width - board.move_count - 1
+        last_depth = empty_cells if max_depth is None else min(max_depth, empty_cells)
+        for depth in range(1, last_depth + 1):
+            for row, col in replies:
+                if self.__ponder_stopped:
+                    return
+                board.make_move(row, col, self.PLAYER)
+                move = ponderer.computer_move(depth)
+                # a search that was not stopped went to the full depth, or found a forced win on the way
+                if not self.__ponder_stopped and move is not None:
+                    self.__pondered[board.hash] = (depth, move)
+                board.unmake_move()
+
+    def predicted_replies(self, count = 1):
+        '''
+        :param count: the number of replies
+        :return: the opponent's most likely replies to the AI's last move: the one of the principal variation
+                 (if it starts with that move), then the best by move ordering
+        '''
+        replies = []
+        variation = self.__principal_variation
+        if len(variation) > 1 and variation[0] == self.__board.last_move and self.is_valid_move(*variation[1]):
+            replies.append(tuple(variation[1]))
+        if len(replies) < count:
+            for move in self.order_moves(self.generate_moves(), self.PLAYER):
+                if move not in replies:
+                    replies.append(move)
+                    if len(replies) == count:
+                        break
+        return replies[:count]
+
+    def stop_pondering(self):
+        '''
+        Stops the background search of ponder and waits for it to end, what it found stays in the transposition table
+        '''
+        if self.__ponder is not None:
+            self.__ponder.cancel()
+            self.__ponder = None
+
+    def extract_principal_variation(self, depth):
+        '''
+        Follows the best moves stored in the transposition table from the current position
+        :param depth: the maximum length of the variation
+        :return: the list of moves, starting with the computer's
+        '''
+        variation = []
+        player = self.COMPUTER
+        for _ in range(depth):
+            entry = self.__transpositions.probe(self.__board.hash ^ SIDE_KEYS[player])
+            if entry is None or entry[3] is None or not self.is_valid_move(*entry[3]):
+                break
+            self.__board.make_move(entry[3][0], entry[3][1], player)
+            variation.append(entry[3])
+            player ^= 1
+
+        for _ in variation:
+            self.__board.unmake_move()
+        return variation
+
+    def minimax(self, depth, player, alpha, beta, maximize=True, last_move=None):
+        '''
+        The minimax algorithm, with alpha-beta pruning. Scores are from the computer's point of view.
+        It is the negamax search below with every child searched with the full window.
         :param depth: the depth of the search
         :param player: the current player
         :param alpha: the alpha value
         :param beta: the beta value
         :param maximize: True if the current player is the maximizing player, False otherwise
+        :param last_move: the move that led to this position (made by the other player), used for the win check
         '''
-        if depth == 0 or self.is_winner(self.PLAYER, 'minmax') or self.is_winner(self.COMPUTER, 'minmax') or self.is_board_full():
-            return self.evaluate_position(), None
+        if player == self.COMPUTER:
+            return self.negamax(depth, player, alpha, beta, last_move, pvs = False)
+        score, move = self.negamax(depth, player, -beta, -alpha, last_move, pvs = False)
+        return -score, move
 
-        moves = self.generate_moves()
+    def negamax(self, depth, player, alpha, beta, last_move = None, pvs = True, ply = 0):
+        '''
+        Negamax with alpha-beta pruning: scores are from the point of view of the player to move.
+        With pvs (Principal Variation Search), only the first move is searched with the full window, the others
+        with a null window that just proves they are not better, and are searched again if they are.
+        Positions are looked up in the transposition table first, stored bounds narrow the window and
+        the stored best move is searched first.
+        :param depth: the depth of the search
+        :param player: the player to move
+        :param alpha: the alpha value
+        :param beta: the beta value
+        :param last_move: the move that led to this position (made by the other player), used for the win check
+        :param pvs: use null windows for all the moves but the first
+        :param ply: the distance from the root of the search, for the killer moves
+        :return: the score and the best move
+        '''
+        self.__nodes += 1
+        if self.__deadline is not None and self.__nodes >= self.__next_check:
+            self.__next_check = self.__nodes + self.CHECK_INTERVAL
+            if time.perf_counter() >= self.__deadline:
+                self.__stopped = True
+        if self.__stopped:
+            return 0, None
 
-        if player == self.COMPUTER:
-            max_eval = float('-inf')
-            best_move = None
-            
-            for move in moves:
-                row, col = move
-                
-                self.__board.add_temp_move(row, col, self.COMPUTER)
-                eval = self.minimax(depth - 1, self.PLAYER, alpha, beta, maximize = False)[0]
-                self.__board.remove_move(row, col)
-                
-                if eval > max_eval:
-                    max_eval = eval
-                    best_move = move
-                alpha = max(alpha, max_eval)
-                
+        if last_move is not None and self.is_winning_move(last_move[0], last_move[1], player ^ 1):
+            return -(self.WIN + depth), None
+        if depth == 0 or self.is_board_full():
+            score = self.evaluate_position()
+            return (score if player == self.COMPUTER else -score), None
+
+        alpha_original = alpha
+        key = self.__board.hash ^ SIDE_KEYS[player]
+        entry = self.__transpositions.probe(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, bound, score, tt_move = entry
+            if entry_depth >= depth:
+                if bound == TranspositionTable.EXACT:
+                    return score, tt_move
+                elif bound == TranspositionTable.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
                 if beta <= alpha:
-                    break
-                
-            return max_eval, best_move
-        
-        else:
-            min_eval = float('inf')
-            best_move = None
-            
-            for move in moves:
-                row, col = move
-                
-                self.__board.add_temp_move(row, col, self.PLAYER)
-                eval = self.minimax(depth - 1, self.COMPUTER, alpha, beta, maximize = True)[0]
-                self.__board.remove_move(row, col)
-                
-                if eval < min_eval:
-                    min_eval = eval
-                    best_move = move
-                    
-                beta = min(beta, min_eval)
+                    return score, tt_move
+
+        cache_key = None
+        if self.__cache is not None and depth >= self.CACHE_DEPTH:
+            cache_key = self.__board.canonical_hash()[0] ^ SIDE_KEYS[player]
+            # the cache has no moves, so the root (which must return one) is searched anyway
+            cached = self.__cache.probe(cache_key) if ply > 0 else None
+            if cached is not None and cached[0] >= depth:
+                _, bound, score = cached
+                if bound == TranspositionTable.EXACT:
+                    return score, tt_move
+                elif bound == TranspositionTable.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
                 if beta <= alpha:
-                    break
-                
-            return min_eval, best_move
+                    return score, tt_move
+
+        # the best move of an earlier search of this position is tried first
+        moves = self.order_moves(self.generate_moves(), player, ply, tt_move)
+
+        best_eval = float('-inf')
+        best_move = None
+        opponent = player ^ 1
+
+        for index, move in enumerate(moves):
+            row, col = move
+            self.__board.make_move(row, col, player)
+            if not pvs or best_move is None:
+                eval = -self.negamax(depth - 1, opponent, -beta, -alpha, move, pvs, ply + 1)[0]
+            else:
+                eval = -self.negamax(depth - 1, opponent, -alpha - 1, -alpha, move, pvs, ply + 1)[0]
+                if alpha < eval < beta and not self.__stopped:
+                    eval = -self.negamax(depth - 1, opponent, -beta, -alpha, move, pvs, ply + 1)[0]
+            self.__board.unmake_move()
+            if self.__stopped:
+                break
+
+            if eval > best_eval:
+                best_eval = eval
+                best_move = move
+            alpha = max(alpha, best_eval)
+
+            if beta <= alpha:
+                self.record_cutoff(move, player, depth, ply, index)
+                break
+
+        if self.__stopped:
+            # the scores of an aborted search are not to be trusted, nothing is stored
+            return best_eval, best_move
+
+        if best_eval <= alpha_original:
+            bound = TranspositionTable.UPPER
+        elif best_eval >= beta:
+            bound = TranspositionTable.LOWER
+        else:
+            bound = TranspositionTable.EXACT
+        self.__transpositions.store(key, depth, bound, best_eval, best_move)
+        if cache_key is not None:
+            self.__cache.store(cache_key, depth, bound, best_eval)
+
+        return best_eval, best_move
     
     def evaluate_position(self):
-        computer_score = self.evaluate_player_score(self.COMPUTER)
-        player_score = self.evaluate_player_score(self.PLAYER)
-
-        return computer_score - player_score
-
-    def evaluate_player_score(self, player):
-        score = 0
-        last_row, last_col = self.__board.last_move
-
-        for direction in [(1, 0), (0, 1), (1, 1), (1, -1)]:
-            player_score = self.evaluate_streak(last_row, last_col, player, direction)
-            opponent_score = self.evaluate_streak(last_row, last_col, player ^ 1, direction)
-            score += player_score - opponent_score
-
-        return score
-
-    def evaluate_streak(self, row, col, player, direction):
-        consecutive_count = 0
-        open_ends = 0
-
-        for k in range(-4, 5):
-            i, j = row + k * direction[0], col + k * direction[1]
-
-            if 0 <= i < self.board_height and 0 <= j < self.board_width:
-                if self.__board.element(i, j) == player:
-                    consecutive_count += 1
-                elif self.__board.element(i, j) == self.EMPTY:
-                    open_ends += 1
-
-        return self.calculate_streak_score(consecutive_count, open_ends, player)
-
-    def calculate_streak_score(self, consecutive_count, open_ends, player):
-        if consecutive_count == 4:
-            return 100000 # Winning move
-        elif consecutive_count == 3 and open_ends == 2:
-            return 100000 # Also winning move
-        elif consecutive_count == 3:
-            return 5000 # Potential winning moves
-        elif consecutive_count == 2 and open_ends == 2:
-            return 500
-        elif consecutive_count == 2 and open_ends == 1:
-            return 50
-        else:
-            return 0
+        '''
+        Evaluates the whole board from the computer's point of view. The board keeps the pattern score of
+        every player up to date on every move (see domain.patterns), so this is O(1).
+        :return: the score of the computer minus the score of the player
+        '''
+        return self.__board.score(self.COMPUTER) - self.__board.score(self.PLAYER)
+
+    def tactical_move(self, max_nodes = 20000):
+        '''
+        The fast pass before the full search: a five of the computer, the block of a five of the player,
+        or the first move of a win by continuous fours (see services.threats), which can be many moves deep.
+        :param max_nodes: the node budget of the threat-space search
+        :return: the row and column of the move, None if the position needs the full search
+        '''
+        threats = ThreatSearch(self.__board, max_nodes)
+        fives = threats.five_cells(self.COMPUTER)
+        if fives:
+            return fives[0]
+        blocks = threats.five_cells(self.PLAYER)
+        if blocks:
+            return blocks[0]
+        sequence = threats.vcf(self.COMPUTER)
+        if sequence is not None:
+            return sequence[0]
+        return None
 
     def check_four_threat(self, row, col, player):
         '''
@@ -247,32 +662,27 @@ class AI:
         Checks if there is a move that the computer player has to block.
         Firstly we check if there are winning moves that require blocking.
         If there are no winning moves, we check if there are 3 consecutive active cells for the player.
-        This is more efficient than letting the minmax search for the blocking move. As the game
-        takes place on a 15x15 board, the minmax is not really ideal. The same goes for searching
-        the winning move.
+        This is more efficient than letting the minmax search for the blocking move. Only the empty cells
+        next to a stone can make a line, so only those are tried, whatever the size of the board.
         :return: True if there is a move that the computer player has to block, None otherwise
         '''
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_move(row, col, self.PLAYER)
-
-                    if self.is_winner(self.PLAYER, 'minmax'):
-                        self.remove_move(row, col)
-                        return row, col
+        cells = [divmod(index, self.board_width) for index in sorted(self.__board.candidates)]
+        for row, col in cells:
+            self.add_temp_move(row, col, self.PLAYER)
+            is_winning = self.is_winning_move(row, col, self.PLAYER)
+            self.remove_move(row, col)
 
-                    self.remove_move(row, col)
+            if is_winning:
+                return row, col
 
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_temp_move(row, col, self.PLAYER)
+        for row, col in cells:
+            self.add_temp_move(row, col, self.PLAYER)
 
-                    if self.check_four_threat(row, col, self.PLAYER):
-                        self.remove_move(row, col)
-                        return row, col
+            if self.check_four_threat(row, col, self.PLAYER):
+                self.remove_move(row, col)
+                return row, col
 
-                    self.remove_move(row, col)
+            self.remove_move(row, col)
 
         return None, None
     
@@ -281,14 +691,14 @@ class AI:
         Checks if there is a winning move for the computer player.
         :return: True if there is a winning move, None otherwise
         '''
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_temp_move(row, col, self.COMPUTER)
-                    if self.is_winner(self.COMPUTER, 'minmax'):
-                        return row, col
-                    
-                    self.remove_move(row, col)
+        for index in sorted(self.__board.candidates):
+            row, col = divmod(index, self.board_width)
+            self.add_temp_move(row, col, self.COMPUTER)
+            is_winning = self.is_winning_move(row, col, self.COMPUTER)
+            self.remove_move(row, col)
+
+            if is_winning:
+                return row, col
         return None, None
     
     def add_move(self, row, col, player = -1):
@@ -303,6 +713,29 @@ class AI:
 
         self.__board.add_move(row, col, player)
         
+    def undo_move(self):
+        '''
+        Takes back the last move, it is then the turn of the player who made it
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        move = self.__board.unmake_move()
+        if move is not None:
+            self.__player = move[2]
+            self.__game_over = False
+        return move
+
+    def redo_move(self):
+        '''
+        Plays again the last move taken back, it is then the turn of the other player
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        move = self.__board.redo_move()
+        if move is not None:
+            player = move[2]
+            if not self.is_winner(player):
+                self.__player = player ^ 1
+        return move
+
     def add_temp_move(self, row, col, player = -1):
         '''
         Adds a temporary move to the board
@@ -0,0 +1,379 @@
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from domain.board import Board
+from services.records import RecordWriter
+from services.game import Game
+from services.ai import AI
+from services.mcts import MCTS
+from services.book import OpeningBook
+from services.eval_cache import EvaluationCache
+from services.instrumentation import SearchStats, aggregate
+
+class HeuristicEngine:
+    '''
+    The rule-based computer of services.game (win, block, play near own stones, random)
+    '''
+    def __init__(self):
+        self.__game = None
+
+    def new_game(self, height = 15, width = 15):
+        self.__game = Game(height, width)
+        self.__game.player = 1
+
+    def play(self, row, col):
+        self.__game.add_specific_move(row, col, 0)
+
+    def move(self):
+        self.__game.player = 1
+        self.__game.make_computer_move()
+        return self.__game.last_move
+
+class MinimaxEngine:
+    '''
+    The minimax AI of services.ai
+    '''
+    def __init__(self, depth = 4, time_limit_ms = None, tt_memory_mb = 16, book = None, cache = None):
+        self.__depth = depth
+        self.__time_limit_ms = time_limit_ms
+        self.__tt_memory_mb = tt_memory_mb
+        self.__book = OpeningBook(book) if book else None
+        # the evaluation cache file, shared by all the games of all the workers
+        self.__cache = EvaluationCache(cache) if cache else None
+        self.__stats = None
+        self.__ai = None
+
+    def instrument(self, stats):
+        '''
+        :param stats: a services.instrumentation.SearchStats for the searches of the next games
+        '''
+        self.__stats = stats
+
+    def new_game(self, height = 15, width = 15):
+        self.__ai = AI(self.__tt_memory_mb, book = self.__book, cache = self.__cache, height = height, width = width)
+        if self.__stats is not None:
+            self.__ai.instrument(self.__stats)
+
+    def play(self, row, col):
+        self.__ai.add_move(row, col, self.__ai.PLAYER)
+
+    def move(self):
+        move = self.__ai.computer_move(self.__depth, self.__time_limit_ms)
+        if move is not None:
+            self.__ai.add_move(move[0], move[1], self.__ai.COMPUTER)
+        return move
+
+class MctsEngine:
+    '''
+    The Monte Carlo Tree Search of services.mcts
+    '''
+    def __init__(self, playouts = 2000, time_limit_ms = None, threads = 1):
+        self.__playouts = playouts
+        self.__time_limit_ms = time_limit_ms
+        self.__threads = threads
+        self.__mcts = None
+
+    def new_game(self, height = 15, width = 15):
+        self.__mcts = MCTS(self.__playouts, self.__threads, board = Board(height, width))
+
+    def play(self, row, col):
+        self.__mcts.add_move(row, col, self.__mcts.PLAYER)
+
+    def move(self):
+        move = self.__mcts.computer_move(None if self.__time_limit_ms else self.__playouts, self.__time_limit_ms)
+        if move is not None:
+            self.__mcts.add_move(move[0], move[1], self.__mcts.COMPUTER)
+        return move
+
+# the protocol entry point of this engine
+PBRAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pbrain.py')
+
+class ProtocolEngine:
+    '''
+    An engine in its own process, driven through the Piskvork protocol (see services.protocol),
+    by default this engine's pbrain.py, or any other Gomocup brain
+    '''
+    def __init__(self, command = None, timeout_turn = 1000):
+        self.__command = shlex.split(command) if command else [sys.executable, PBRAIN]
+        self.__timeout_turn = timeout_turn
+        self.__process = None
+        self.__opponent_move = None
+
+    def __send(self, line):
+        self.__process.stdin.write(line + '\n')
+        self.__process.stdin.flush()
+
+    def __answer(self):
+        '''
+        :return: the next answer of the brain, its MESSAGE and DEBUG lines skipped
+        '''
+        while True:
+            line = self.__process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"the brain {' '.join(self.__command)} exited")
+            line = line.strip()
+            if line and line.split(' ')[0] not in ('MESSAGE', 'DEBUG', 'UNKNOWN'):
+                return line
+
+    def new_game(self, height = 15, width = 15):
+        self.close()
+        self.__process = subprocess.Popen(self.__command, stdin = subprocess.PIPE, stdout = subprocess.PIPE, text = True)
+        self.__opponent_move = None
+        self.__send(f"INFO timeout_turn {self.__timeout_turn}")
+        self.__send(f"START {height}" if height == width else f"RECTSTART {width},{height}")
+        answer = self.__answer()
+        if answer != 'OK':
+            raise RuntimeError(f"the brain refused the board: {answer}")
+
+    def play(self, row, col):
+        self.__opponent_move = (row, col)
+
+    def move(self):
+        if self.__opponent_move is None:
+            self.__send('BEGIN')
+        else:
+            row, col = self.__opponent_move
+            self.__send(f"TURN {col},{row}")
+        try:
+            x, y = (int(value) for value in self.__answer().split(','))
+        except ValueError:
+            return None
+        return y, x
+
+    def close(self):
+        '''
+        Ends the brain's process
+        '''
+        if self.__process is not None:
+            try:
+                self.__send('END')
+                self.__process.wait(timeout = 5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.__process.kill()
+            self.__process = None
+
+# every engine sees its own stones as player 1 and the opponent's as player 0
+ENGINES = {
+    'heuristic': HeuristicEngine,
+    'minimax': MinimaxEngine,
+    'mcts': MctsEngine,
+    'pbrain': ProtocolEngine
+}
+
+def _parse_value(value):
+    if value == 'None':
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def create_engine(spec):
+    '''
+    Builds an engine from its description, e.g. "heuristic", "minimax:depth=2,time_limit_ms=500" or "mcts:time_limit_ms=500"
+    :param spec: the name of the engine, optionally followed by ':' and comma separated options
+    :return: the engine
+    '''
+    name, _, options = spec.partition(':')
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine '{name}', expected one of {', '.join(ENGINES)}")
+    kwargs = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        kwargs[key.strip()] = _parse_value(value.strip())
+    return ENGINES[name](**kwargs)
+
+def play_game(game_id, first_spec, second_spec, height = 15, width = 15, trace = None):
+    '''
+    Plays one game between two engines, without any UI
+    :param game_id: the number of the game
+    :param first_spec: the engine that moves first (stones 0)
+    :param second_spec: the engine that moves second (stones 1)
+    :param trace: the JSON-lines file the statistics of every search are appended to (see services.instrumentation),
+                  None to search without statistics
+    :return: a dict with the winner (0, 1 or None for a draw), the moves, and the time every move took,
+             plus the statistics of the searches of both engines with a trace (None for the engines without any)
+    '''
+    # the heuristic engine plays random moves when it has nothing better, every game gets its own seed
+    np.random.seed(game_id)
+    engines = [create_engine(first_spec), create_engine(second_spec)]
+    stats = [None, None]
+    for player, (engine, spec) in enumerate(zip(engines, (first_spec, second_spec))):
+        if trace and hasattr(engine, 'instrument'):
+            stats[player] = SearchStats(trace, {'game': game_id, 'engine': spec, 'player': player})
+            engine.instrument(stats[player])
+        engine.new_game(height, width)
+    board = Board(height, width)
+    moves = []
+    latencies = [[], []]
+    winner = None
+    reason = 'full'
+    player = 0
+    start = time.perf_counter()
+
+    try:
+        while board.move_count < height * width:
+            move_start = time.perf_counter()
+            move = engines[player].move()
+            latencies[player].append((time.perf_counter() - move_start) * 1000)
+
+            if move is None or not (0 <= move[0] < height and 0 <= move[1] < width) or board.element(*move) != -1:
+                winner, reason = player ^ 1, 'illegal move'
+                break
+
+            row, col = move
+            board.add_move(row, col, player)
+            engines[player ^ 1].play(row, col)
+            moves.append([row, col])
+
+            if any(board.count_line(row, col, direction, player) >= 5 for direction in range(4)):
+                winner, reason = player, 'five'
+                break
+            player ^= 1
+    finally:
+        # the engines that run in their own process are ended with the game
+        for engine in engines:
+            if hasattr(engine, 'close'):
+                engine.close()
+
+    result = {
+        'game': game_id,
+        'first': first_spec,
+        'second': second_spec,
+        'winner': winner,
+        'reason': reason,
+        'move_count': len(moves),
+        'moves': moves,
+        'latency_ms': latencies,
+        'seconds': time.perf_counter() - start
+    }
+    if trace:
+        result['search'] = [aggregate(player_stats.records) if player_stats else None for player_stats in stats]
+    return result
+
+def elo_difference(score):
+    '''
+    :param score: the score of an engine, between 0 and 1 (a draw counts as half a win)
+    :return: the Elo difference that score corresponds to
+    '''
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+class Arena:
+    '''
+    Plays a match of N games between two engines, alternating who moves first. The games run in parallel
+    processes and every result is written to a JSON-lines file as soon as the game is over.
+    '''
+    def __init__(self, engine_a, engine_b, games = 10, workers = None, height = 15, width = 15):
+        self.__engines = (engine_a, engine_b)
+        self.__games = games
+        self.__workers = workers
+        self.__height = height
+        self.__width = width
+
+    def run(self, output = None, on_result = None, records = None, trace = None):
+        '''
+        Plays the match
+        :param output: the path of the JSON-lines file the results are streamed to, None for no file
+        :param on_result: called with every result as it comes in
+        :param records: the directory the games are also appended to as game records (see services.records),
+                        None for no records
+        :param trace: the JSON-lines file the statistics of every search go to, None for no statistics
+        :return: the aggregated statistics (see summarize)
+        '''
+        results = []
+        start = time.perf_counter()
+        stream = open(output, 'a') if output else None
+        writer = RecordWriter(records) if records else None
+        try:
+            with ProcessPoolExecutor(max_workers = self.__workers) as executor:
+                futures = []
+                for game_id in range(self.__games):
+                    first, second = self.__engines if game_id % 2 == 0 else self.__engines[::-1]
+                    futures.append(executor.submit(play_game, game_id, first, second, self.__height, self.__width, trace))
+
+                for future in as_completed(futures):
+                    result = future.result()
+                    # the winner from the match's point of view: 'a', 'b' or None
+                    a_moved_first = result['game'] % 2 == 0
+                    if result['winner'] is None:
+                        result['winner_engine'] = None
+                    else:
+                        result['winner_engine'] = 'a' if (result['winner'] == 0) == a_moved_first else 'b'
+                    results.append(result)
+                    if stream:
+                        stream.write(json.dumps(result) + '\n')
+                        stream.flush()
+                    if writer:
+                        writer.write({
+                            'height': self.__height,
+                            'width': self.__width,
+                            'first': result['first'],
+                            'second': result['second'],
+                            'winner': result['winner'],
+                            'moves': result['moves']
+                        })
+                    if on_result:
+                        on_result(result)
+        finally:
+            if stream:
+                stream.close()
+            if writer:
+                writer.close()
+
+        return self.summarize(results, time.perf_counter() - start)
+
+    def summarize(self, results, seconds):
+        '''
+        :param results: the results of the games
+        :param seconds: the wall-clock time of the match
+        :return: wins, draws, score, Elo difference and move latency of engine a against engine b, plus the throughput,
+                 and the search statistics of both engines if the games were traced
+        '''
+        a_wins = sum(1 for result in results if result['winner_engine'] == 'a')
+        b_wins = sum(1 for result in results if result['winner_engine'] == 'b')
+        draws = len(results) - a_wins - b_wins
+        score = (a_wins + draws / 2) / len(results) if results else 0.5
+
+        latencies = {'a': [], 'b': []}
+        for result in results:
+            a_moved_first = result['game'] % 2 == 0
+            latencies['a'].extend(result['latency_ms'][0 if a_moved_first else 1])
+            latencies['b'].extend(result['latency_ms'][1 if a_moved_first else 0])
+        total_moves = sum(result['move_count'] for result in results)
+
+        summary = {
+            'engine_a': self.__engines[0],
+            'engine_b': self.__engines[1],
+            'games': len(results),
+            'a_wins': a_wins,
+            'b_wins': b_wins,
+            'draws': draws,
+            'a_score': score,
+            'a_win_rate': a_wins / len(results) if results else 0.0,
+            'elo_difference': elo_difference(score),
+            'a_mean_latency_ms': sum(latencies['a']) / len(latencies['a']) if latencies['a'] else 0.0,
+            'b_mean_latency_ms': sum(latencies['b']) / len(latencies['b']) if latencies['b'] else 0.0,
+            'seconds': seconds,
+            'games_per_second': len(results) / seconds if seconds else 0.0,
+            'moves_per_second': total_moves / seconds if seconds else 0.0
+        }
+
+        searches = {'a': [], 'b': []}
+        for result in results:
+            a_moved_first = result['game'] % 2 == 0
+            for player, stats in enumerate(result.get('search') or ()):
+                if stats is not None:
+                    searches['a' if (player == 0) == a_moved_first else 'b'].append(stats)
+        for engine, stats in searches.items():
+            if stats:
+                summary[f'{engine}_search'] = aggregate(stats)
+        return summary
@@ -0,0 +1,58 @@
+import threading
+
+class BackgroundSearch:
+    '''
+    Runs an engine search in a background thread, so the caller (e.g. the GUI's event loop) never blocks on it.
+    The handle tells whether the search is done, gives its result and can cancel it.
+    '''
+    def __init__(self, search, stop = None):
+        '''
+        Starts the search
+        :param search: the function that searches and returns the result
+        :param stop: the function that asks the search to stop early (e.g. AI.stop), None if it cannot be stopped
+        '''
+        self.__search = search
+        self.__stop = stop
+        self.__result = None
+        self.__error = None
+        self.__cancelled = False
+        self.__thread = threading.Thread(target = self.__run, daemon = True)
+        self.__thread.start()
+
+    def __run(self):
+        try:
+            self.__result = self.__search()
+        except Exception as error:
+            self.__error = error
+
+    @property
+    def done(self):
+        return not self.__thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self.__cancelled
+
+    def result(self, timeout = None):
+        '''
+        Waits for the search to finish
+        :param timeout: the maximum time to wait, in seconds, None to wait as long as it takes
+        :return: the result of the search, None if it is not done yet
+        '''
+        self.__thread.join(timeout)
+        if self.__thread.is_alive():
+            return None
+        if self.__error is not None:
+            raise self.__error
+        return self.__result
+
+    def cancel(self):
+        '''
+        Stops the search and waits for the thread to end. The result is whatever the search returns when stopped.
+        '''
+        self.__cancelled = True
+        while self.__thread.is_alive():
+            # asked again and again, in case the search had not started yet the first time
+            if self.__stop is not None:
+                self.__stop()
+            self.__thread.join(0.05)
@@ -0,0 +1,256 @@
+import json
+import time
+import tracemalloc
+import numpy as np
+from services.game import Game
+from services.ai import AI
+from services import batch_eval
+from services.instrumentation import SearchStats, aggregate
+
+# (row, col, player) in the order they were played, the computer (1) is to move in all of them
+POSITIONS = {
+    'opening_center': {
+        'category': 'opening',
+        'moves': [(7, 7, 0)]
+    },
+    'opening_diagonal': {
+        'category': 'opening',
+        'moves': [(7, 7, 0), (8, 8, 1), (6, 8, 0)]
+    },
+    'midgame_cluster': {
+        'category': 'midgame',
+        'moves': [
+            (7, 7, 0), (7, 8, 1), (8, 8, 0), (6, 6, 1), (8, 7, 0), (8, 6, 1),
+            (9, 8, 0), (6, 8, 1), (10, 9, 0), (11, 10, 1), (9, 7, 0)
+        ]
+    },
+    'midgame_spread': {
+        'category': 'midgame',
+        'moves': [
+            (7, 7, 0), (6, 8, 1), (5, 5, 0), (8, 9, 1), (9, 6, 0), (7, 10, 1),
+            (4, 7, 0), (9, 9, 1), (6, 4, 0), (10, 8, 1), (8, 5, 0), (5, 9, 1), (3, 6, 0)
+        ]
+    },
+    'tactical_block_four': {
+        'category': 'tactical',
+        'moves': [(7, 4, 0), (6, 4, 1), (7, 5, 0), (6, 5, 1), (7, 6, 0), (8, 8, 1), (7, 7, 0)]
+    },
+    'tactical_open_three': {
+        'category': 'tactical',
+        'moves': [(7, 7, 0), (6, 6, 1), (8, 8, 0), (6, 8, 1), (9, 9, 0)]
+    },
+    'tactical_win': {
+        'category': 'tactical',
+        'moves': [(3, 3, 0), (7, 5, 1), (3, 4, 0), (7, 6, 1), (12, 2, 0), (7, 7, 1), (2, 12, 0), (7, 8, 1), (11, 11, 0)]
+    }
+}
+
+def _moves(name, size):
+    '''
+    :return: the moves of the position, moved to the middle of a board of the given size (at least 15)
+    '''
+    offset = (size - 15) // 2
+    return [(row + offset, col + offset, player) for row, col, player in POSITIONS[name]['moves']]
+
+def load_ai(name, size = 15, **options):
+    '''
+    :param name: the name of one of the POSITIONS
+    :param size: the size of the board, the position is put in its middle
+    :return: an AI with the position on its board
+    '''
+    ai = AI(height = size, width = size, **options)
+    for row, col, player in _moves(name, size):
+        ai.add_move(row, col, player)
+    return ai
+
+def load_game(name, size = 15):
+    '''
+    :param name: the name of one of the POSITIONS
+    :param size: the size of the board, the position is put in its middle
+    :return: a Game with the position on its board, the computer to move
+    '''
+    game = Game(size, size)
+    for row, col, player in _moves(name, size):
+        game.add_specific_move(row, col, player)
+    game.player = 1
+    return game
+
+def _minimax(name, depth, size, stats = None):
+    ai = load_ai(name, size)
+    ai.instrument(stats)
+    def run():
+        if stats is not None:
+            # minimax is not a whole computer_move, the search is recorded here
+            stats.begin()
+        _, move = ai.minimax(depth, ai.COMPUTER, float('-inf'), float('inf'), True, ai.last_move)
+        if stats is not None:
+            stats.end(move)
+        return ai.nodes, move
+    return run
+
+def _computer_move(name, depth, size, stats = None):
+    ai = load_ai(name, size)
+    ai.instrument(stats)
+    def run():
+        move = ai.computer_move(depth)
+        return ai.nodes, move
+    return run
+
+def _repeat(function, repeats):
+    def run():
+        result = None
+        for _ in range(repeats):
+            result = function()
+        return repeats, result
+    return run
+
+def _generate_moves(name, repeats, size):
+    return _repeat(load_ai(name, size).generate_moves, repeats)
+
+def _is_winner(name, repeats, size):
+    ai = load_ai(name, size)
+    return _repeat(lambda: ai.is_winner(ai.PLAYER, 'minmax'), repeats)
+
+def _search_blocking_move(name, repeats, size):
+    # the game plays the blocking move it finds, so every call gets a fresh copy of the position
+    games = [load_game(name, size) for _ in range(repeats)]
+    def run():
+        found = None
+        for game in games:
+            found = game.search_blocking_move()
+        return repeats, found
+    return run
+
+def _tactical_move(name, repeats, size):
+    ai = load_ai(name, size)
+    return _repeat(ai.tactical_move, repeats)
+
+def _batch_evaluate(name, count, size):
+    # positions/sec of the batch evaluation: the position, count times in one (N, H, W) stack
+    boards = np.repeat(load_ai(name, size).board[None].astype(np.int8), count, axis = 0)
+    def run():
+        return count, int(batch_eval.evaluate(boards)[0])
+    return run
+
+# entry point -> (factory of the measured function, default depth or number of calls)
+ENTRY_POINTS = {
+    'minimax': (_minimax, 3),
+    'computer_move': (_computer_move, 3),
+    'generate_moves': (_generate_moves, 1000),
+    'is_winner': (_is_winner, 1000),
+    'search_blocking_move': (_search_blocking_move, 20),
+    'tactical_move': (_tactical_move, 20),
+    'batch_evaluate': (_batch_evaluate, 1000)
+}
+# the entry points that search, their factories take search statistics (see services.instrumentation)
+SEARCHES = ('minimax', 'computer_move')
+
+def measure(name, entry_point, parameter = None, memory = True, size = 15, instrument = False, trace = None):
+    '''
+    Runs one entry point of the engine on one position
+    :param name: the name of one of the POSITIONS
+    :param entry_point: the name of one of the ENTRY_POINTS
+    :param parameter: the depth of a search or the number of calls of the other entry points, None for the default
+    :param memory: measure the peak memory too (in a second, traced run, the timed run is never traced)
+    :param size: the size of the board
+    :param instrument: for the SEARCHES, collect search statistics too (in another run, the timed run has none)
+    :param trace: the JSON-lines file the statistics of every search are appended to
+    :return: a dict with the nodes (or calls), the time, nodes/sec, the time per move and the peak memory,
+             plus the search statistics if they were collected
+    '''
+    factory, default = ENTRY_POINTS[entry_point]
+    parameter = default if parameter is None else parameter
+
+    run = factory(name, parameter, size)
+    start = time.perf_counter()
+    nodes, result = run()
+    seconds = time.perf_counter() - start
+
+    peak_kb = None
+    if memory:
+        run = factory(name, parameter, size)
+        tracemalloc.start()
+        run()
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    search = None
+    if instrument and entry_point in SEARCHES:
+        stats = SearchStats(trace, {'position': name, 'entry_point': entry_point, 'parameter': parameter, 'size': size})
+        factory(name, parameter, size, stats)()
+        search = aggregate(stats.records)
+
+    result = {
+        'position': name,
+        'category': POSITIONS[name]['category'],
+        'entry_point': entry_point,
+        'parameter': parameter,
+        'size': size,
+        'nodes': nodes,
+        'seconds': seconds,
+        'nodes_per_second': nodes / seconds if seconds else 0.0,
+        'time_to_move_ms': seconds * 1000,
+        'peak_memory_kb': peak_kb,
+        'result': list(result) if isinstance(result, tuple) else result
+    }
+    if search is not None:
+        result['search'] = search
+    return result
+
+def run_suite(positions = None, entry_points = None, parameters = None, memory = True, on_result = None, sizes = (15,),
+              instrument = False, trace = None):
+    '''
+    Runs every entry point on every position
+    :param positions: the names of the positions, None for all of them
+    :param entry_points: the names of the entry points, None for all of them
+    :param parameters: a dict entry point -> depth / number of calls, to override the defaults
+    :param memory: measure the peak memory too
+    :param on_result: called with every measurement as it is made
+    :param sizes: the sizes of the boards, every position is measured on each of them
+    :param instrument: collect search statistics for the searches too (see measure)
+    :param trace: the JSON-lines file the statistics of every search are appended to
+    :return: the list of measurements
+    '''
+    parameters = parameters or {}
+    results = []
+    for size in sizes:
+        for name in positions or POSITIONS:
+            for entry_point in entry_points or ENTRY_POINTS:
+                result = measure(name, entry_point, parameters.get(entry_point), memory, size, instrument, trace)
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    return results
+
+def compare(results, baseline, tolerance = 0.2):
+    '''
+    Looks for performance regressions against an earlier run
+    :param results: the measurements of this run
+    :param baseline: the measurements of the earlier run
+    :param tolerance: how much slower (in nodes/sec, as a fraction) a measurement may be
+    :return: the list of regressions, as dicts with the position, the entry point and both speeds
+    '''
+    # results saved before the board size was measured are all on 15x15 boards
+    def key_of(result):
+        return result['position'], result['entry_point'], result['parameter'], result.get('size', 15)
+
+    earlier = {key_of(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        key = key_of(result)
+        if key in earlier and result['nodes_per_second'] < earlier[key]['nodes_per_second'] * (1 - tolerance):
+            regressions.append({
+                'position': result['position'],
+                'entry_point': result['entry_point'],
+                'baseline_nodes_per_second': earlier[key]['nodes_per_second'],
+                'nodes_per_second': result['nodes_per_second']
+            })
+    return regressions
+
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent = 2)
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,177 @@
+'''
+Opening book: the known good replies to the first moves of a game.
+
+A position is looked up by its canonical hash (Board.canonical_hash), so one entry covers its 8 rotations
+and reflections; the replies are stored as they are in the canonical position and mapped back on lookup.
+The hash is the one of the player to move, its stones hashed as player 0's: a reply is only ever found for
+the side that played it, whatever colour that side has.
+
+The file is a header followed by the entries sorted by hash, which are memory-mapped on the first lookup
+and binary-searched, so opening a book costs nothing and a lookup a few microseconds.
+'''
+import json
+import os
+import struct
+import numpy as np
+from domain.board import Board, transform, INVERSE_SYMMETRY
+
+MAGIC = b'GMKB'
+VERSION = 2
+# magic, version, height, width, unused, number of entries
+HEADER = struct.Struct('<4sHHHHQ')
+ENTRY = np.dtype([('hash', '<u8'), ('row', 'u1'), ('col', 'u1'), ('weight', '<u4')])
+
+def _read(path):
+    '''
+    :return: the height, the width and the memory-mapped entries of a book file
+    '''
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"'{path}' is not an opening book")
+    magic, version, height, width, _, count = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"'{path}' is not an opening book of version {VERSION}")
+    if os.path.getsize(path) != HEADER.size + count * ENTRY.itemsize:
+        raise ValueError(f"'{path}' is truncated")
+    if count == 0:
+        return height, width, np.zeros(0, dtype = ENTRY)
+    return height, width, np.memmap(path, dtype = ENTRY, mode = 'r', offset = HEADER.size, shape = (count,))
+
+class OpeningBook:
+    def __init__(self, path):
+        '''
+        :param path: the book file, it is only read on the first lookup
+        '''
+        self.__path = path
+        self.__entries = None
+        self.__height = None
+        self.__width = None
+
+    def __load(self):
+        if self.__entries is None:
+            self.__height, self.__width, self.__entries = _read(self.__path)
+
+    @property
+    def size(self):
+        '''
+        The number of (position, reply) entries
+        '''
+        self.__load()
+        return len(self.__entries)
+
+    def replies(self, board, player = None):
+        '''
+        :param board: the position (domain.board.Board)
+        :param player: the player to move, None for the one whose turn it is when player 0 moves first
+        :return: the book replies, as (row, col, weight), the best first; empty if the position is not in the book
+        '''
+        self.__load()
+        if board.height != self.__height or board.width != self.__width or not len(self.__entries):
+            return []
+        if player is None:
+            player = board.move_count % 2
+        key, symmetry = board.canonical_hash(player)
+        hashes = self.__entries['hash']
+        start = np.searchsorted(hashes, np.uint64(key), 'left')
+        end = np.searchsorted(hashes, np.uint64(key), 'right')
+        inverse = INVERSE_SYMMETRY[symmetry]
+        replies = []
+        for entry in self.__entries[start:end]:
+            row, col = transform(inverse, int(entry['row']), int(entry['col']), board.height, board.width)
+            if board.element(row, col) == -1:
+                replies.append((row, col, int(entry['weight'])))
+        return sorted(replies, key = lambda reply: -reply[2])
+
+    def move(self, board, generator = None, player = None):
+        '''
+        :param board: the position
+        :param generator: a random.Random to pick a reply in proportion to its weight, None for the best one
+        :param player: the player to move, None for the one whose turn it is when player 0 moves first
+        :return: the row and column of the book move, None if the position is not in the book
+        '''
+        replies = self.replies(board, player)
+        if not replies:
+            return None
+        if generator is None:
+            return replies[0][:2]
+        row, col, _ = generator.choices(replies, weights = [reply[2] for reply in replies])[0]
+        return row, col
+
+class BookBuilder:
+    '''
+    Collects the replies played in finished games: a move scores 2 when its player won, 1 in a draw
+    and nothing when it lost.
+    '''
+    def __init__(self, height = 15, width = 15, max_moves = 10):
+        '''
+        :param max_moves: the number of moves of every game that go into the book
+        '''
+        self.__height = height
+        self.__width = width
+        self.__max_moves = max_moves
+        # canonical hash -> {reply in the canonical position: weight}
+        self.__replies = {}
+
+    @property
+    def size(self):
+        return sum(len(replies) for replies in self.__replies.values())
+
+    def add_game(self, moves, winner):
+        '''
+        :param moves: the moves of the game, as (row, col), the first player (0) moving first
+        :param winner: the player who won (0 or 1), None for a draw
+        '''
+        board = Board(self.__height, self.__width)
+        for ply, (row, col) in enumerate(moves[:self.__max_moves]):
+            player = ply % 2
+            points = 1 if winner is None else 2 if winner == player else 0
+            if points:
+                key, symmetry = board.canonical_hash(player)
+                reply = transform(symmetry, row, col, self.__height, self.__width)
+                replies = self.__replies.setdefault(key, {})
+                replies[reply] = replies.get(reply, 0) + points
+            board.add_move(row, col, player)
+
+    def add_results(self, path):
+        '''
+        Adds the games of an arena results file (JSON lines, see services.arena)
+        :return: the number of games added
+        '''
+        games = 0
+        with open(path) as file:
+            for line in file:
+                result = json.loads(line)
+                if result['reason'] == 'illegal move':
+                    continue
+                self.add_game(result['moves'], result['winner'])
+                games += 1
+        return games
+
+    def add_book(self, path):
+        '''
+        Adds the entries of an existing book, to extend it
+        '''
+        height, width, entries = _read(path)
+        if (height, width) != (self.__height, self.__width):
+            raise ValueError(f"'{path}' is a book for {height}x{width} boards")
+        for entry in entries:
+            replies = self.__replies.setdefault(int(entry['hash']), {})
+            reply = (int(entry['row']), int(entry['col']))
+            replies[reply] = replies.get(reply, 0) + int(entry['weight'])
+
+    def save(self, path):
+        '''
+        Writes the book, sorted by hash and by weight (the best reply first)
+        '''
+        rows = sorted(
+            (key, row, col, min(weight, 0xFFFFFFFF))
+            for key, replies in self.__replies.items() for (row, col), weight in replies.items()
+        )
+        entries = np.array(rows, dtype = ENTRY) if rows else np.zeros(0, dtype = ENTRY)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.__height, self.__width, 0, len(entries)))
+            file.write(entries.tobytes())
+        # a book that is being read is never seen half-written
+        os.replace(temporary, path)
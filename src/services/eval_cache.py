@@ -0,0 +1,186 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b'GMKC'
+VERSION = 1
+# magic, version, slots per bucket, number of slots, crc32 of the fields before it
+HEADER = struct.Struct('<4sHHQI')
+HEADER_BYTES = 64
+SLOT = np.dtype([('key', '<u8'), ('check', '<u8'), ('score', '<i8'), ('depth', '<i8')])
+MASK = (1 << 64) - 1
+
+def _check(key, depth, bound, score):
+    '''
+    :return: the checksum of a slot, a slot half-written by another process does not match it
+    '''
+    return (key ^ (score & MASK) ^ (depth << 48) ^ (bound << 40) ^ 0x9E3779B97F4A7C15) & MASK
+
+class EvaluationCache:
+    '''
+    The results of earlier searches, kept in a file that outlives the process and is shared by all the
+    processes that open it. Positions are keyed by their canonical hash (Board.canonical_hash) and the
+    player to move, so the rotations and reflections of a position share an entry.
+
+    The file is a fixed-size open-addressing table, memory-mapped: every process reads and writes the
+    slots in place, nothing is pickled or copied. A key goes to a bucket of BUCKET consecutive slots;
+    a new entry takes the slot of its key or an empty one, and when the bucket is full it evicts the
+    entry searched the least deep (the first one of them on a tie).
+
+    A file with the wrong magic, version or header checksum is ignored: the cache then misses on every
+    probe and drops every store, so a broken file can never give a wrong answer.
+    '''
+    BUCKET = 4
+
+    def __init__(self, path, memory_mb = 64):
+        '''
+        Opens the cache file, creating it if it does not exist
+        :param path: the file
+        :param memory_mb: the size of a new file (an existing file keeps its size)
+        '''
+        self.__path = path
+        self.__table = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if not os.path.exists(path):
+            self.create(path, memory_mb)
+        self.__open()
+
+    @staticmethod
+    def create(path, memory_mb = 64):
+        '''
+        Writes an empty cache file, replacing the one that is there
+        '''
+        buckets = max(1, int(memory_mb * 2 ** 20) // (SLOT.itemsize * EvaluationCache.BUCKET))
+        slots = buckets * EvaluationCache.BUCKET
+        fields = HEADER.pack(MAGIC, VERSION, EvaluationCache.BUCKET, slots, 0)[:-4]
+        header = fields + struct.pack('<I', zlib.crc32(fields))
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(header.ljust(HEADER_BYTES, b'\0'))
+            file.truncate(HEADER_BYTES + slots * SLOT.itemsize)
+        os.replace(temporary, path)
+
+    def __open(self):
+        with open(self.__path, 'rb') as file:
+            header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        magic, version, bucket, slots, checksum = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or bucket != self.BUCKET or checksum != zlib.crc32(header[:-4]):
+            return
+        if slots == 0 or slots % bucket or os.path.getsize(self.__path) != HEADER_BYTES + slots * SLOT.itemsize:
+            return
+        self.__table = np.memmap(self.__path, dtype = SLOT, mode = 'r+', offset = HEADER_BYTES, shape = (slots,))
+        self.__keys = self.__table['key']
+        self.__checks = self.__table['check']
+        self.__scores = self.__table['score']
+        self.__depths = self.__table['depth']
+        self.__buckets = slots // bucket
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def valid(self):
+        '''
+        False if the file was ignored (see the class)
+        '''
+        return self.__table is not None
+
+    @property
+    def capacity(self):
+        return 0 if self.__table is None else len(self.__table)
+
+    @property
+    def size(self):
+        '''
+        The number of filled slots (it counts them, so it is not for the search itself)
+        '''
+        return 0 if self.__table is None else int(np.count_nonzero(self.__keys))
+
+    def probe(self, key):
+        '''
+        Looks the position up
+        :param key: the canonical hash of the position, xor-ed with the key of the player to move
+        :return: (depth, bound type, score) if the position is stored, None otherwise
+        '''
+        if self.__table is not None:
+            key &= MASK
+            start = key % self.__buckets * self.BUCKET
+            for slot in range(start, start + self.BUCKET):
+                if int(self.__keys[slot]) == key:
+                    packed = int(self.__depths[slot])
+                    depth, bound = packed >> 8, packed & 0xFF
+                    score = int(self.__scores[slot])
+                    if int(self.__checks[slot]) == _check(key, depth, bound, score):
+                        self.hits += 1
+                        return depth, bound, score
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, score):
+        '''
+        Stores the result of a search
+        :param key: the canonical hash of the position, xor-ed with the key of the player to move
+        :param depth: the depth the position was searched to
+        :param bound: TranspositionTable.EXACT, LOWER or UPPER
+        :param score: the score of the position, for the player to move
+        '''
+        if self.__table is None:
+            return
+        key &= MASK
+        if key == 0:
+            # 0 marks the empty slots
+            return
+        start = key % self.__buckets * self.BUCKET
+        target = None
+        shallowest = None
+        for slot in range(start, start + self.BUCKET):
+            stored = int(self.__keys[slot])
+            if stored == key:
+                if int(self.__depths[slot]) >> 8 > depth:
+                    return
+                target = slot
+                break
+            if stored == 0:
+                if target is None:
+                    target = slot
+            elif shallowest is None or int(self.__depths[slot]) >> 8 < int(self.__depths[shallowest]) >> 8:
+                shallowest = slot
+        if target is None:
+            target = shallowest
+            self.evictions += 1
+
+        self.__keys[target] = key
+        self.__scores[target] = score
+        self.__depths[target] = depth << 8 | bound
+        self.__checks[target] = _check(key, depth, bound, score)
+        self.stores += 1
+
+    def flush(self):
+        '''
+        Writes the changes to the file
+        '''
+        if self.__table is not None:
+            self.__table.flush()
+
+    def stats(self):
+        '''
+        :return: the hit/miss counters and the fill of the cache, as a dict
+        '''
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'size': self.size,
+            'capacity': self.capacity,
+            'valid': self.valid
+        }
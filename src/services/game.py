@@ -1,9 +1,16 @@
-from domain.board import Board
+from domain.board import Board, DIRECTIONS
 import numpy as np
 
+def _shifted(padded, row_offset, col_offset, height, width):
+    '''
+    :param padded: a board-shaped mask, padded with 4 cells of zeros on every side
+    :return: the mask moved so that cell (row, col) of the result holds cell (row + row_offset, col + col_offset)
+    '''
+    return padded[4 + row_offset:4 + row_offset + height, 4 + col_offset:4 + col_offset + width]
+
 class Game:
-    def __init__(self):
-        self.__board = Board()
+    def __init__(self, height = 15, width = 15):
+        self.__board = Board(height, width)
         self.__game_over = False
         self.__player = 0
     
@@ -21,7 +28,7 @@ class Game:
     
     @property
     def board_width(self):
-        return self.__board.height
+        return self.__board.width
     
     @property
     def game_over(self):
@@ -79,6 +86,29 @@ class Game:
         if 0 <= row < self.board_height and 0 <= col < self.board_width:
             self.__board.remove_move(row, col)
     
+    def undo_move(self):
+        '''
+        Takes back the last move, it is then the turn of the player who made it
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        move = self.__board.unmake_move()
+        if move is not None:
+            self.__player = move[2]
+            self.__game_over = False
+        return move
+
+    def redo_move(self):
+        '''
+        Plays again the last move taken back, it is then the turn of the other player
+        :return: the move, as (row, col, player), None if there is none
+        '''
+        move = self.__board.redo_move()
+        if move is not None:
+            row, col, player = move
+            if not self.is_winner(row, col, player):
+                self.__player = player ^ 1
+        return move
+    
     def is_winner(self, row, col, player):
         '''
         Checks if the current player is the winner, based on the last move
@@ -103,23 +133,10 @@ class Game:
         :param col_step: the step for the column
         :return: True if there are 5 consecutive moves, False otherwise
         '''
-        max_count = 0
-        count = 0
-        for direction in [1, -1]:
-            for i in range(5):
-                current_row = row + i * row_step * direction
-                current_col = col + i * col_step * direction
-                if 0 <= current_row < self.board_height and 0 <= current_col < self.board_width:
-                    if self.__board.element(current_row, current_col) == player:
-                        count += 1
-                        max_count = max(max_count, count)
-                        if max_count == 5:
-                            self.__game_over = True
-                            return True
-                    else:
-                        count = 0
-                else:
-                    count = 0
+        step = (row_step, col_step) if (row_step, col_step) in DIRECTIONS else (-row_step, -col_step)
+        if self.__board.element(row, col) == player and self.__board.count_line(row, col, DIRECTIONS.index(step), player) >= 5:
+            self.__game_over = True
+            return True
         return False
     
     def has_nearby_moves(self, row, col):
@@ -135,20 +152,76 @@ class Game:
                     return True
         return False
     
+    def player_masks(self, player):
+        '''
+        :param player: the player
+        :return: the masks of the player's stones and of the empty cells, padded with 4 cells of zeros on every side
+        '''
+        board = self.__board.board
+        return np.pad(board == player, 4), np.pad(board == -1, 4)
+
+    def winning_cells(self, player):
+        '''
+        Finds, in one pass over the whole board, every empty cell that would complete five in a row for the player:
+        the empty cell of every 5-cell window (in the four directions) that holds 4 of the player's stones.
+        :param player: the player
+        :return: a boolean mask with the shape of the board
+        '''
+        height, width = self.board_height, self.board_width
+        own, empty = self.player_masks(player)
+        cells = np.zeros((height, width), dtype = bool)
+        for row_step, col_step in DIRECTIONS:
+            own_count = sum(_shifted(own, k * row_step, k * col_step, height, width).astype(int) for k in range(5))
+            empty_count = sum(_shifted(empty, k * row_step, k * col_step, height, width).astype(int) for k in range(5))
+            windows = np.pad((own_count == 4) & (empty_count == 1), 4)
+            # the window starting k cells before a cell covers it
+            for k in range(5):
+                cells |= _shifted(windows, -k * row_step, -k * col_step, height, width)
+        return cells & _shifted(empty, 0, 0, height, width)
+
+    def four_threat_cells(self, player):
+        '''
+        Finds, in one pass over the whole board, every empty cell on which check_four_threat would be True
+        after the player puts a stone there: the cells that complete a 4-cell window of the player's stones,
+        the window starting 1 to 3 cells before them (0 to 3 on the anti-diagonal, which check_four_threat
+        scans both ways).
+        :param player: the player
+        :return: a boolean mask with the shape of the board
+        '''
+        height, width = self.board_height, self.board_width
+        own, empty = self.player_masks(player)
+        cells = np.zeros((height, width), dtype = bool)
+        for row_step, col_step in DIRECTIONS:
+            own_count = sum(_shifted(own, k * row_step, k * col_step, height, width).astype(int) for k in range(4))
+            windows = np.pad(own_count == 3, 4)
+            starts = range(-3, 1) if (row_step, col_step) == (1, -1) else range(-3, 0)
+            for start in starts:
+                cells |= _shifted(windows, start * row_step, start * col_step, height, width)
+        return cells & _shifted(empty, 0, 0, height, width)
+
+    def first_cell(self, cells):
+        '''
+        :param cells: a boolean mask with the shape of the board
+        :return: the first (row-major) cell set in the mask, None if there is none
+        '''
+        indices = np.flatnonzero(cells)
+        if len(indices) == 0:
+            return None
+        return divmod(int(indices[0]), self.board_width)
+
     def search_winning_move(self):
         '''
         Checks if there is a winning move for the computer player. Makes the move if there is one.
+        The candidates are found with a few array operations over the whole board (see winning_cells).
         :return: True if there is a winning move, False otherwise
         '''
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_move(row, col)
-                    if self.is_winner(row, col, 1):
-                        return True
-                    
-                    self.remove_move(row, col)
-        return False
+        cell = self.first_cell(self.winning_cells(1))
+        if cell is None:
+            return False
+
+        row, col = cell
+        self.add_move(row, col)
+        return self.is_winner(row, col, 1)
     
     def check_four_threat(self, row, col, player):
         '''
@@ -182,35 +255,18 @@ class Game:
         Checks if there is a move that the computer player has to block.
         Firstly we check if there are winning moves that require blocking.
         If there are no winning moves, we check if there are 3 consecutive active cells for the player.
-        In both cases we block.
+        In both cases we block. Both checks are a few array operations over the whole board.
         :return: True if there is a move that the computer player has to block, False otherwise
         '''
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_specific_move(row, col, 0)
-                    
-                    if self.is_winner(row, col, 0):
-                        self.remove_move(row, col)
-                        self.__game_over = False
-                        self.add_move(row, col)
-                        return True
-                    
-                    self.remove_move(row, col)
-                    
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col):
-                    self.add_specific_move(row, col, 0)
-                    
-                    if self.check_four_threat(row, col, 0):
-                        self.remove_move(row, col)
-                        self.add_move(row, col)
-                        return True
-                    
-                    self.remove_move(row, col)
-                    
-        return False
+        cell = self.first_cell(self.winning_cells(0))
+        if cell is None:
+            cell = self.first_cell(self.four_threat_cells(0))
+        if cell is None:
+            return False
+
+        row, col = cell
+        self.add_move(row, col)
+        return True
     
     def search_nearby_move(self):
         '''
@@ -218,11 +274,12 @@ class Game:
         This is in case there are no winning moves or blocking moves.
         :return: True if there is a nearby move, False otherwise
         '''
-        for row in range(self.board_height):
-            for col in range(self.board_width):
-                if self.is_valid_move(row, col) and self.has_nearby_moves(row, col):
-                    self.add_move(row, col)
-                    return True
+        # only the empty cells next to a stone can be next to a computer stone
+        for index in sorted(self.__board.candidates):
+            row, col = divmod(index, self.board_width)
+            if self.has_nearby_moves(row, col):
+                self.add_move(row, col)
+                return True
         return False
     
     def make_random_move(self):
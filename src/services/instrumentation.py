@@ -0,0 +1,252 @@
+'''
+Statistics of the AI's searches, one record per search (per computer_move), as JSON lines.
+
+Nothing here runs unless a SearchStats is attached to an AI: attach swaps timing and counting wrappers in
+for some of the AI's methods, on that AI object only, and detach takes them out again, so an AI without
+statistics runs its plain methods and pays nothing.
+'''
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+class _Sampler(threading.Thread):
+    '''
+    Looks at what a thread is running every interval, and counts the functions it finds it in
+    '''
+    def __init__(self, thread_id, interval_ms):
+        super().__init__(daemon = True)
+        self.__thread_id = thread_id
+        self.__interval = interval_ms / 1000
+        self.__done = threading.Event()
+        self.counts = {}
+
+    def run(self):
+        while not self.__done.wait(self.__interval):
+            frame = sys._current_frames().get(self.__thread_id)
+            if frame is not None:
+                name = _function_name(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                self.counts[name] = self.counts.get(name, 0) + 1
+
+    def stop(self):
+        self.__done.set()
+        self.join()
+
+def _function_name(filename, line, name):
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+class SearchStats:
+    '''
+    Counts and times what the searches of an AI do:
+    - the nodes, the leaf evaluations and the transposition table probes (and hits),
+    - the beta cutoffs, by the index of the move that caused them (a well ordered search cuts on the first move),
+    - the time and nodes of every iteration of the iterative deepening,
+    - the calls and time of the PHASES of the search,
+    - with profile = 'cprofile' or 'sample', where the time goes, function by function.
+    Every search ends in a record, kept in records and written as a JSON line to the output.
+    '''
+    PHASES = ('generate_moves', 'order_moves', 'evaluate_position', 'is_winning_move')
+    PROFILES = (None, 'cprofile', 'sample')
+    TOP_FUNCTIONS = 20
+
+    def __init__(self, output = None, context = None, profile = None, sample_interval_ms = 1):
+        '''
+        :param output: the path of the JSON-lines file the records are appended to, or an open file, None for none
+        :param context: fields added to every record, e.g. the engine or the position
+        :param profile: None, 'cprofile' (every call, slow) or 'sample' (a look at the stack every sample_interval_ms)
+        '''
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown profile '{profile}', expected one of {', '.join(map(str, self.PROFILES))}")
+        self.__output = output
+        self.__context = dict(context or {})
+        self.__profile = profile
+        self.__sample_interval_ms = sample_interval_ms
+        self.__ai = None
+        self.__profiler = None
+        self.records = []
+        self.__reset()
+
+    def __reset(self):
+        self.__start = None
+        self.__tt_start = (0, 0)
+        self.__cutoffs = []
+        self.__depths = []
+        self.__phases = {name: [0, 0.0] for name in self.PHASES}
+
+    def attach(self, ai):
+        '''
+        Swaps the counting wrappers in for the methods of the AI
+        '''
+        self.detach()
+        self.__ai = ai
+        for name in self.PHASES:
+            setattr(ai, name, self.__timed(name, getattr(ai, name)))
+        ai.record_cutoff = self.__counted_cutoff(ai.record_cutoff)
+        ai.aspiration_search = self.__timed_iteration(ai.aspiration_search)
+        ai.computer_move = self.__recorded(ai.computer_move)
+
+    def detach(self):
+        '''
+        Takes the wrappers out, the AI runs its plain methods again
+        '''
+        if self.__ai is not None:
+            for name in self.PHASES + ('record_cutoff', 'aspiration_search', 'computer_move'):
+                self.__ai.__dict__.pop(name, None)
+            self.__ai = None
+
+    def __timed(self, name, method):
+        clock = time.perf_counter
+        def timed(*args, **kwargs):
+            start = clock()
+            result = method(*args, **kwargs)
+            # the counters are new for every search, so they are looked up on every call
+            phase = self.__phases[name]
+            phase[0] += 1
+            phase[1] += clock() - start
+            return result
+        return timed
+
+    def __counted_cutoff(self, method):
+        def counted(move, player, depth, ply, index = 0):
+            cutoffs = self.__cutoffs
+            while len(cutoffs) <= index:
+                cutoffs.append(0)
+            cutoffs[index] += 1
+            return method(move, player, depth, ply, index)
+        return counted
+
+    def __timed_iteration(self, method):
+        def timed(depth, previous_score = None):
+            start = time.perf_counter()
+            score, move = method(depth, previous_score)
+            self.__depths.append({
+                'depth': depth,
+                'seconds': time.perf_counter() - start,
+                'nodes': self.__ai.nodes,
+                'score': score if abs(score) != float('inf') else None
+            })
+            return score, move
+        return timed
+
+    def __recorded(self, method):
+        def recorded(*args, **kwargs):
+            self.begin()
+            move = method(*args, **kwargs)
+            self.end(move)
+            return move
+        return recorded
+
+    def begin(self):
+        '''
+        Starts a search (computer_move calls it when the stats are attached)
+        '''
+        self.__reset()
+        table = self.__ai.transposition_table
+        self.__tt_start = (table.hits, table.misses)
+        if self.__profile == 'cprofile':
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+        elif self.__profile == 'sample':
+            self.__profiler = _Sampler(threading.get_ident(), self.__sample_interval_ms)
+            self.__profiler.start()
+        self.__start = time.perf_counter()
+
+    def end(self, move):
+        '''
+        Ends the search: makes its record, keeps it and writes it out
+        :param move: the move the search returned
+        :return: the record
+        '''
+        seconds = time.perf_counter() - self.__start
+        profile = None
+        if self.__profile == 'cprofile':
+            self.__profiler.disable()
+            entries = pstats.Stats(self.__profiler).stats.items()
+            top = sorted(entries, key = lambda entry: -entry[1][2])[:self.TOP_FUNCTIONS]
+            profile = [[_function_name(*function), calls, total] for function, (_, calls, total, _, _) in top]
+        elif self.__profile == 'sample':
+            self.__profiler.stop()
+            top = sorted(self.__profiler.counts.items(), key = lambda entry: -entry[1])[:self.TOP_FUNCTIONS]
+            profile = [[function, samples] for function, samples in top]
+        self.__profiler = None
+
+        ai = self.__ai
+        table = ai.transposition_table
+        hits = table.hits - self.__tt_start[0]
+        probes = hits + table.misses - self.__tt_start[1]
+        record = dict(self.__context)
+        record.update({
+            'searches': 1,
+            'move': list(move) if move is not None else None,
+            'depth': ai.completed_depth,
+            'nodes': ai.nodes,
+            'leaf_evaluations': self.__phases['evaluate_position'][0],
+            'tt_probes': probes,
+            'tt_hits': hits,
+            'beta_cutoffs': sum(self.__cutoffs),
+            'cutoffs_by_index': self.__cutoffs,
+            'iterations': self.__depths,
+            'phases': {name: {'calls': calls, 'seconds': total} for name, (calls, total) in self.__phases.items()},
+            'seconds': seconds,
+            'nodes_per_second': ai.nodes / seconds if seconds else 0.0,
+            'profile': profile
+        })
+        self.records.append(record)
+        self.__write(record)
+        return record
+
+    def __write(self, record):
+        if self.__output is None:
+            return
+        line = json.dumps(record) + '\n'
+        if hasattr(self.__output, 'write'):
+            self.__output.write(line)
+            self.__output.flush()
+        else:
+            # one short append per search, so processes can share the file
+            with open(self.__output, 'a') as file:
+                file.write(line)
+
+def load(path):
+    '''
+    :return: the records of a JSON-lines file
+    '''
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def aggregate(records):
+    '''
+    Adds up records, or earlier aggregates (they have the same counters)
+    :param records: the records
+    :return: the totals, the rates (TT hit rate, the share of cutoffs on the first move) and the mean depth
+    '''
+    searches = sum(record['searches'] for record in records)
+    totals = {key: sum(record[key] for record in records) for key in ('nodes', 'leaf_evaluations', 'tt_probes', 'tt_hits', 'beta_cutoffs', 'seconds')}
+    cutoffs = []
+    phases = {}
+    depth = 0
+    for record in records:
+        for index, count in enumerate(record['cutoffs_by_index']):
+            if index == len(cutoffs):
+                cutoffs.append(0)
+            cutoffs[index] += count
+        for name, phase in record['phases'].items():
+            total = phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            total['calls'] += phase['calls']
+            total['seconds'] += phase['seconds']
+        depth += record.get('depth', record.get('mean_depth', 0)) * record['searches']
+
+    summary = {'searches': searches}
+    summary.update(totals)
+    summary.update({
+        'cutoffs_by_index': cutoffs,
+        'first_move_cutoff_rate': cutoffs[0] / totals['beta_cutoffs'] if totals['beta_cutoffs'] else 0.0,
+        'tt_hit_rate': totals['tt_hits'] / totals['tt_probes'] if totals['tt_probes'] else 0.0,
+        'phases': phases,
+        'mean_depth': depth / searches if searches else 0.0,
+        'nodes_per_second': totals['nodes'] / totals['seconds'] if totals['seconds'] else 0.0
+    })
+    return summary
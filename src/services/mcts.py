@@ -0,0 +1,251 @@
+import math
+import random
+import threading
+import time
+from domain.board import Board
+from domain.patterns import THREE
+
+class Node:
+    '''
+    A node of the search tree: the position after `move` was played by `player`.
+    `wins` is counted from the point of view of that player.
+    '''
+    __slots__ = ('move', 'player', 'parent', 'children', 'untried', 'visits', 'wins', 'winner')
+
+    def __init__(self, move, player, parent = None):
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = None # the moves not expanded yet, filled on the first visit
+        self.visits = 0
+        self.wins = 0.0
+        self.winner = None # the player who won with this move, None if the game goes on
+
+class MCTS:
+    '''
+    Monte Carlo Tree Search (UCT), with the same interface as the minimax AI (add_move, computer_move, stop).
+    A playout walks down the tree by the UCB1 formula, expands one move and plays a short rollout in which
+    every move is the best (by the pattern tables) of a few random candidates, then scores the position
+    with the static evaluation. The search is anytime: it returns the most visited move whenever it is stopped.
+    The tree below the moves that were played is kept for the next search.
+    With several threads, the playouts share the tree, and every node on the way down counts as lost
+    (a virtual loss) until its playout is over, so that the threads spread over different branches.
+    '''
+    def __init__(self, playouts = 2000, threads = 1, exploration = 1.4, rollout_depth = 6, sample = 8, board = None):
+        '''
+        :param playouts: the default number of playouts of a search
+        :param threads: the number of threads that share the tree
+        :param exploration: the exploration constant of UCB1
+        :param rollout_depth: the number of moves of a rollout, before the static evaluation
+        :param sample: the number of random candidates the best rollout move is chosen from
+        :param board: the board to play on, a new 15x15 one if None
+        '''
+        self.__board = board if board is not None else Board()
+        self.__playouts = playouts
+        self.__threads = threads
+        self.__exploration = exploration
+        self.__rollout_depth = rollout_depth
+        self.__sample = sample
+        self.__lock = threading.Lock()
+        self.__nodes = 0
+        self.__stopped = False
+        self.__random = random.Random(0)
+        self.COMPUTER = 1
+        self.PLAYER = 0
+        self.EMPTY = -1
+        self.SCALE = 2 * THREE # the score difference that makes a position about 73% won
+        last_move = self.__board.last_move
+        self.__root = Node(last_move, self.PLAYER if last_move is None else self.__board.element(*last_move))
+
+    @property
+    def board(self):
+        return self.__board.board
+
+    @property
+    def last_move(self):
+        return self.__board.last_move
+
+    @property
+    def nodes(self):
+        '''
+        The number of playouts of the last search
+        '''
+        return self.__nodes
+
+    @property
+    def tree_size(self):
+        '''
+        The number of visits of the root, including the ones kept from earlier searches
+        '''
+        return self.__root.visits
+
+    def is_valid_move(self, row, col):
+        return 0 <= row < self.__board.height and 0 <= col < self.__board.width and self.__board.element(row, col) == -1
+
+    def add_move(self, row, col, player):
+        '''
+        Plays a move, and keeps the part of the tree below it
+        :param row: the row of the move
+        :param col: the column of the move
+        :param player: the player who makes it
+        '''
+        self.__board.add_move(row, col, player)
+        for child in self.__root.children:
+            if child.move == (row, col):
+                child.parent = None
+                self.__root = child
+                return
+        self.__root = Node((row, col), player)
+
+    def stop(self):
+        '''
+        Asks the running search to stop, it returns the most visited move so far
+        '''
+        self.__stopped = True
+
+    def computer_move(self, playouts = None, time_limit_ms = None):
+        '''
+        Searches for the move of the computer player (it is not played)
+        :param playouts: the number of playouts, None for the default one (or no limit if a time limit is given)
+        :param time_limit_ms: the time budget in milliseconds, None for no limit
+        :return: the row and column of the move, None if the board is full
+        '''
+        board = self.__board
+        if board.move_count == 0:
+            return board.height // 2, board.width // 2
+        if not board.candidates:
+            return None
+        if playouts is None and time_limit_ms is None:
+            playouts = self.__playouts
+        deadline = None if time_limit_ms is None else time.perf_counter() + time_limit_ms / 1000
+
+        self.__nodes = 0
+        self.__stopped = False
+        if self.__threads == 1:
+            self.__search(board, playouts, deadline)
+        else:
+            workers = [
+                threading.Thread(target = self.__search, args = (board.copy(), playouts, deadline))
+                for _ in range(self.__threads)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        if not self.__root.children:
+            # stopped before the first playout
+            return self.__ordered_moves(board, self.COMPUTER)[-1]
+        best = max(self.__root.children, key = lambda child: child.visits)
+        return best.move
+
+    def __search(self, board, playouts, deadline):
+        '''
+        The playout loop of one thread, on its own board
+        '''
+        while not self.__stopped:
+            with self.__lock:
+                if playouts is not None and self.__nodes >= playouts:
+                    return
+                self.__nodes += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            self.__playout(board)
+
+    def __playout(self, board):
+        path = []
+        with self.__lock:
+            node = self.__root
+            node.visits += 1
+            # selection, the visits are counted on the way down (the virtual loss)
+            while node.winner is None and node.untried == [] and node.children:
+                node = self.__select(node)
+                node.visits += 1
+                board.make_move(node.move[0], node.move[1], node.player)
+                path.append(node)
+            # expansion
+            if node.winner is None:
+                if node.untried is None:
+                    node.untried = self.__ordered_moves(board, node.player ^ 1)
+                if node.untried:
+                    move = node.untried.pop()
+                    child = Node(move, node.player ^ 1, node)
+                    board.make_move(move[0], move[1], child.player)
+                    if self.__is_five(board, move, child.player):
+                        child.winner = child.player
+                    node.children.append(child)
+                    node = child
+                    node.visits += 1
+                    path.append(node)
+
+        if node.winner is not None:
+            value = 1.0
+        elif board.move_count == board.height * board.width:
+            value = 0.5
+        else:
+            value = self.__rollout(board, node.player)
+
+        for _ in path:
+            board.unmake_move()
+
+        with self.__lock:
+            # backpropagation, value is the result for the player of the leaf
+            leaf_player = node.player
+            while node is not None:
+                node.wins += value if node.player == leaf_player else 1.0 - value
+                node = node.parent
+
+    def __select(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.__exploration
+        return max(
+            node.children,
+            key = lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+        )
+
+    def __ordered_moves(self, board, player):
+        '''
+        :return: the candidate moves of the player, the most promising (by the pattern tables) last
+        '''
+        width = board.width
+        def gain(index):
+            row, col = divmod(index, width)
+            return board.gain(row, col, player) + board.gain(row, col, player ^ 1), -index
+        return [divmod(index, width) for index in sorted(board.candidates, key = gain)]
+
+    def __rollout(self, board, player):
+        '''
+        Plays a few moves from the position, every one the best of a small random sample of candidates,
+        and takes them back
+        :param player: the player who made the last move
+        :return: the result for that player, between 0 and 1
+        '''
+        width = board.width
+        played = []
+        value = None
+        mover = player
+        for _ in range(self.__rollout_depth):
+            if not board.candidates:
+                break
+            mover ^= 1
+            candidates = list(board.candidates)
+            if len(candidates) > self.__sample:
+                candidates = self.__random.sample(candidates, self.__sample)
+            index = max(candidates, key = lambda index: board.gain(index // width, index % width, mover) + board.gain(index // width, index % width, mover ^ 1))
+            move = divmod(index, width)
+            board.make_move(move[0], move[1], mover)
+            played.append(move)
+            if self.__is_five(board, move, mover):
+                value = 1.0 if mover == player else 0.0
+                break
+
+        if value is None:
+            difference = board.score(player) - board.score(player ^ 1)
+            value = 1 / (1 + math.exp(max(-50, min(50, -difference / self.SCALE))))
+        for _ in played:
+            board.unmake_move()
+        return value
+
+    def __is_five(self, board, move, player):
+        return any(board.count_line(move[0], move[1], direction, player) >= 5 for direction in range(4))
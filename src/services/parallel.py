@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+def _search_root_moves(board, moves, depth, tt_memory_mb, cache_path = None):
+    '''
+    Runs in a worker process: searches a share of the root moves on its own copy of the board
+    :param cache_path: the file of the evaluation cache, None for no cache
+    :return: (best score, best move, nodes searched)
+    '''
+    from services.ai import AI
+    from services.eval_cache import EvaluationCache
+
+    ai = AI(tt_memory_mb, board, cache = EvaluationCache(cache_path) if cache_path else None)
+    score, move = ai.search_root_moves(moves, depth)
+    return score, move, ai.nodes
+
+class ParallelSearch:
+    '''
+    Root-splitting search over a pool of processes. The root moves are dealt round-robin to the workers,
+    every worker searches its share in root order (narrowing its own window as minimax does) on a copy
+    of the board, and the best results are merged. Ties go to the move that comes first in the root
+    order, so the move is the same as the one of the serial minimax to the same depth.
+    '''
+    def __init__(self, workers = None, tt_memory_mb = 16, cache_path = None):
+        self.__workers = workers or os.cpu_count() or 1
+        self.__tt_memory_mb = tt_memory_mb
+        # the workers open the evaluation cache file themselves, only its path goes to them
+        self.__cache_path = cache_path
+        self.__executor = None
+        self.__nodes = 0
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    def search(self, board, moves, depth):
+        '''
+        Searches the root moves of the computer
+        :param board: the board (it is copied into the workers, not modified)
+        :param moves: the root moves, in the order the serial search would try them (AI.root_moves)
+        :param depth: the depth of the search
+        :return: (best score, best move)
+        '''
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers = self.__workers)
+
+        shares = [moves[start::self.__workers] for start in range(self.__workers)]
+        futures = [
+            self.__executor.submit(_search_root_moves, board, share, depth, self.__tt_memory_mb, self.__cache_path)
+            for share in shares if share
+        ]
+
+        best_score, best_move = float('-inf'), None
+        self.__nodes = 0
+        for future in futures:
+            score, move, nodes = future.result()
+            self.__nodes += nodes
+            if move is None:
+                continue
+            if best_move is None or score > best_score or score == best_score and moves.index(move) < moves.index(best_move):
+                best_score, best_move = score, move
+        return best_score, best_move
+
+    def shutdown(self):
+        '''
+        Stops the worker processes
+        '''
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+def speedup_report(ai, depth, worker_counts = (1, 2, 4)):
+    '''
+    Times the parallel search of the AI's position against the serial one
+    :param ai: the AI whose position is searched (it is not modified)
+    :param depth: the depth of the searches
+    :param worker_counts: the numbers of workers to try
+    :return: a list of dicts, the serial search first and then one per worker count: mode, workers, seconds,
+             nodes, speedup, efficiency and whether the move matches the serial search
+    '''
+    from services.ai import AI
+
+    serial = AI(board = ai.board_copy())
+    start = time.perf_counter()
+    _, serial_move = serial.minimax(depth, serial.COMPUTER, float('-inf'), float('inf'), True, serial.last_move)
+    serial_seconds = time.perf_counter() - start
+
+    report = [{
+        'mode': 'serial',
+        'workers': 1,
+        'seconds': serial_seconds,
+        'nodes': serial.nodes,
+        'speedup': 1.0,
+        'efficiency': 1.0,
+        'same_move': True
+    }]
+    for workers in worker_counts:
+        parallel = AI(board = ai.board_copy())
+        with ParallelSearch(workers) as search:
+            # the pool is started outside the timing
+            search.search(parallel.board_copy(), parallel.root_moves()[:workers], 1)
+            start = time.perf_counter()
+            _, move = search.search(parallel.board_copy(), parallel.root_moves(), depth)
+            seconds = time.perf_counter() - start
+        report.append({
+            'mode': 'parallel',
+            'workers': workers,
+            'seconds': seconds,
+            'nodes': search.nodes,
+            'speedup': serial_seconds / seconds if seconds else 0.0,
+            'efficiency': serial_seconds / seconds / workers if seconds else 0.0,
+            'same_move': move == serial_move
+        })
+    return report
@@ -0,0 +1,204 @@
+'''
+The Piskvork (Gomocup) engine protocol: one command per line on stdin, the answers on stdout.
+Coordinates are "x,y", x being the column and y the row, both from 0.
+'''
+import sys
+import time
+from services.ai import AI
+
+class PiskvorkEngine:
+    '''
+    Wraps the AI for tournament managers. The AI's own stones (player 1) are the "1" of the BOARD command,
+    the opponent's (player 0) the "2". The time of a move follows the INFO limits: timeout_turn caps it, and
+    with a timeout_match it is also at most a share of time_left, so the engine never runs out of time.
+    max_memory sizes the transposition table. With ponder, the AI thinks on the opponent's time, from its move
+    to the next command.
+    '''
+    ABOUT = 'name="gomoku", version="1.0", author="orcrobert", country="RO"'
+    MARGIN_MS = 50 # kept back from every move, for the answer to get through the pipe
+    MOVES_LEFT = 20 # a move may use at most 1/MOVES_LEFT of the time left for the match
+    FASTEST_MS = 50 # the budget of a move with timeout_turn 0, "as fast as possible"
+    DEPTH = 4 # the depth of a move with no time limit at all
+
+    def __init__(self, ponder = False):
+        self.__ponder = ponder
+        self.__ai = None
+        self.__height = self.__width = None
+        self.__board_moves = None # the stones of a BOARD command, until DONE
+        self.__timeout_turn = 5000
+        self.__timeout_match = 0
+        self.__time_left = None
+        self.__max_memory = 0
+        self.__ended = False
+
+    @property
+    def ai(self):
+        return self.__ai
+
+    @property
+    def ended(self):
+        return self.__ended
+
+    def time_limit_ms(self):
+        '''
+        :return: the time budget of the next move, in milliseconds, None if there is no limit
+        '''
+        limits = []
+        if self.__timeout_turn > 0:
+            limits.append(self.__timeout_turn - self.MARGIN_MS)
+        elif self.__timeout_turn == 0:
+            limits.append(self.FASTEST_MS)
+        if self.__timeout_match > 0 and self.__time_left is not None:
+            limits.append(self.__time_left / self.MOVES_LEFT - self.MARGIN_MS)
+        if not limits:
+            return None
+        return max(1, min(limits))
+
+    def tt_memory_mb(self):
+        '''
+        :return: the size of the transposition table, half of max_memory (the rest is Python itself)
+        '''
+        if self.__max_memory <= 0:
+            return 16
+        return max(1, self.__max_memory / 2 / 2 ** 20)
+
+    def new_game(self, height, width):
+        if self.__ai is not None:
+            self.__ai.stop_pondering()
+        self.__height, self.__width = height, width
+        self.__ai = AI(self.tt_memory_mb(), height = height, width = width)
+
+    def move(self):
+        '''
+        Searches and plays the AI's move
+        :return: the answer, "x,y", or an ERROR if the board is full
+        '''
+        ai = self.__ai
+        start = time.perf_counter()
+        time_limit_ms = self.time_limit_ms()
+        move = ai.tactical_move()
+        if move is None:
+            if time_limit_ms is not None:
+                # the tactical pass comes out of the same budget
+                time_limit_ms = max(1, time_limit_ms - (time.perf_counter() - start) * 1000)
+            # without a limit, the iterative deepening would never end
+            move = ai.computer_move(None if time_limit_ms is not None else self.DEPTH, time_limit_ms)
+        if move is None:
+            return 'ERROR no move, the board is full'
+        row, col = move
+        ai.add_move(row, col, ai.COMPUTER)
+        if self.__ponder:
+            ai.ponder()
+        return f"{col},{row}"
+
+    def handle(self, line):
+        '''
+        Runs one command
+        :param line: the line read from the manager
+        :return: the lines to answer, possibly none
+        '''
+        line = line.strip()
+        if not line:
+            return []
+        if self.__ai is not None:
+            # whatever the command, the opponent's time is over
+            self.__ai.stop_pondering()
+        if self.__board_moves is not None:
+            return self.__board_line(line)
+
+        command, _, arguments = line.partition(' ')
+        command = command.upper()
+        try:
+            if command == 'START':
+                size = int(arguments)
+                if size < 5:
+                    return ['ERROR unsupported size']
+                self.new_game(size, size)
+                return ['OK']
+            elif command == 'RECTSTART':
+                width, height = (int(value) for value in arguments.split(','))
+                if width < 5 or height < 5:
+                    return ['ERROR unsupported size']
+                self.new_game(height, width)
+                return ['OK']
+            elif command == 'RESTART':
+                self.new_game(self.__height, self.__width)
+                return ['OK']
+            elif command == 'INFO':
+                self.__info(arguments)
+                return []
+            elif command == 'ABOUT':
+                return [self.ABOUT]
+            elif command == 'END':
+                self.__ended = True
+                return []
+            elif self.__ai is None:
+                return ['ERROR no START yet']
+            elif command == 'BEGIN':
+                return [self.move()]
+            elif command == 'TURN':
+                row, col = self.__cell(arguments)
+                if not self.__ai.is_valid_move(row, col):
+                    return ['ERROR invalid move']
+                self.__ai.add_move(row, col, self.__ai.PLAYER)
+                return [self.move()]
+            elif command == 'BOARD':
+                self.__board_moves = []
+                return []
+            elif command == 'TAKEBACK':
+                row, col = self.__cell(arguments)
+                self.__ai.remove_move(row, col)
+                return ['OK']
+        except ValueError:
+            return [f'ERROR bad arguments: {line}']
+        return [f'UNKNOWN {line}']
+
+    def __cell(self, arguments):
+        x, y = (int(value) for value in arguments.split(','))
+        return y, x
+
+    def __info(self, arguments):
+        key, _, value = arguments.partition(' ')
+        if key == 'timeout_turn':
+            self.__timeout_turn = int(value)
+        elif key == 'timeout_match':
+            self.__timeout_match = int(value)
+        elif key == 'time_left':
+            self.__time_left = int(value)
+        elif key == 'max_memory':
+            self.__max_memory = int(value)
+            if self.__ai is not None:
+                # a new table of the right size, on the same board
+                self.__ai = AI(self.tt_memory_mb(), self.__ai.board_copy())
+        # the other keys (game_type, rule, evaluate, folder) do not change how the AI plays
+
+    def __board_line(self, line):
+        '''
+        One line of a BOARD command: "x,y,field" or DONE
+        '''
+        if line.upper() != 'DONE':
+            try:
+                x, y, field = (int(value) for value in line.split(','))
+            except ValueError:
+                return [f'ERROR bad arguments: {line}']
+            self.__board_moves.append((y, x, self.__ai.COMPUTER if field == 1 else self.__ai.PLAYER))
+            return []
+
+        moves, self.__board_moves = self.__board_moves, None
+        self.new_game(self.__height, self.__width)
+        for row, col, player in moves:
+            self.__ai.add_move(row, col, player)
+        return [self.move()]
+
+    def run(self, input = sys.stdin, output = sys.stdout):
+        '''
+        Answers the commands until END or the end of the input
+        '''
+        for line in input:
+            for answer in self.handle(line):
+                output.write(answer + '\n')
+                output.flush()
+            if self.__ended:
+                break
+        if self.__ai is not None:
+            self.__ai.stop_pondering()
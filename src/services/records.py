@@ -0,0 +1,285 @@
+'''
+Game records: the games, in a compact binary form, appended to chunked files.
+
+A chunk file (games-00000.gmr, ...) starts with MAGIC and holds up to chunk_games records, one after the other.
+A record is its length and then, all as unsigned LEB128 varints except the text:
+    height, width, result (0 or 1 the winner, 2 a draw), the two engine names (length and UTF-8),
+    the number of moves, and every move as the index row * width + col.
+A move of a 15x15 board takes 1 or 2 bytes, a whole game a few dozen.
+
+Every chunk has an index (games-00000.idx): the offset of every record, as little-endian 64-bit integers,
+which is memory-mapped to read any game by its id without going through the ones before it.
+'''
+import os
+import numpy as np
+from domain.board import Board
+
+MAGIC = b'GMKR\x01'
+DRAW = 2
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def read_varint(data, position):
+    '''
+    :return: the value and the position after it
+    '''
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def encode_game(game):
+    '''
+    :param game: a dict with height, width, first, second (the engines), winner (0, 1 or None) and moves ([row, col])
+    :return: the record, its length first
+    '''
+    body = bytearray()
+    width = game['width']
+    write_varint(body, game['height'])
+    write_varint(body, width)
+    write_varint(body, DRAW if game['winner'] is None else game['winner'])
+    for name in (game['first'], game['second']):
+        text = (name or '').encode()
+        write_varint(body, len(text))
+        body += text
+    write_varint(body, len(game['moves']))
+    for row, col in game['moves']:
+        write_varint(body, row * width + col)
+    record = bytearray()
+    write_varint(record, len(body))
+    return bytes(record + body)
+
+def decode_game(data, position = 0):
+    '''
+    :param data: bytes holding a record at the position
+    :return: the game (see encode_game) and the position after the record
+    '''
+    length, position = read_varint(data, position)
+    end = position + length
+    height, position = read_varint(data, position)
+    width, position = read_varint(data, position)
+    result, position = read_varint(data, position)
+    names = []
+    for _ in range(2):
+        size, position = read_varint(data, position)
+        names.append(bytes(data[position:position + size]).decode())
+        position += size
+    count, position = read_varint(data, position)
+    moves = []
+    for _ in range(count):
+        index, position = read_varint(data, position)
+        moves.append(list(divmod(index, width)))
+    game = {
+        'height': height,
+        'width': width,
+        'first': names[0],
+        'second': names[1],
+        'winner': None if result == DRAW else result,
+        'moves': moves
+    }
+    return game, end
+
+def _chunk_path(directory, chunk, extension):
+    return os.path.join(directory, f"games-{chunk:05d}.{extension}")
+
+def _chunks(directory):
+    '''
+    :return: the numbers of the chunks in the directory, in order
+    '''
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[6:11]) for name in os.listdir(directory) if name.startswith('games-') and name.endswith('.gmr'))
+
+class RecordWriter:
+    '''
+    Appends games to the chunk files of a directory (created if needed), after the games already there
+    '''
+    def __init__(self, directory, chunk_games = 10000):
+        '''
+        :param directory: the directory of the chunk files
+        :param chunk_games: the number of games of a chunk file
+        '''
+        os.makedirs(directory, exist_ok = True)
+        self.__directory = directory
+        self.__chunk_games = chunk_games
+        chunks = _chunks(directory)
+        self.__chunk = chunks[-1] if chunks else 0
+        self.__games = 0 # in the current chunk
+        self.__data = None
+        self.__index = None
+        if chunks:
+            self.__games = self.__recover(self.__chunk)
+        self.__total = self.__chunk * chunk_games + self.__games
+
+    def __recover(self, chunk):
+        '''
+        Cuts a chunk back to its last whole, indexed record: a crash can leave a record without its index
+        entry, part of a record, or part of an index entry, and the next games must start right after it
+        :return: the number of games of the chunk
+        '''
+        data_path = _chunk_path(self.__directory, chunk, 'gmr')
+        index_path = _chunk_path(self.__directory, chunk, 'idx')
+        size = os.path.getsize(data_path)
+        offsets = []
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as file:
+                raw = file.read()
+            offsets = np.frombuffer(raw[:len(raw) // 8 * 8], dtype = '<u8').tolist()
+        end = len(MAGIC) if size >= len(MAGIC) else 0
+        with open(data_path, 'rb') as file:
+            # the records go before their index entries, so only the last entries can point past the data
+            while offsets:
+                file.seek(offsets[-1])
+                head = file.read(10)
+                try:
+                    length, start = read_varint(head, 0)
+                except IndexError:
+                    start = length = size
+                if offsets[-1] + start + length <= size:
+                    end = offsets[-1] + start + length
+                    break
+                offsets.pop()
+        with open(data_path, 'r+b') as file:
+            file.truncate(end)
+        with open(index_path, 'ab') as file:
+            file.truncate(len(offsets) * 8)
+        return len(offsets)
+
+    def __open(self):
+        data_path = _chunk_path(self.__directory, self.__chunk, 'gmr')
+        self.__data = open(data_path, 'ab')
+        if self.__data.tell() == 0:
+            self.__data.write(MAGIC)
+        self.__index = open(_chunk_path(self.__directory, self.__chunk, 'idx'), 'ab')
+
+    def write(self, game):
+        '''
+        Appends a game
+        :param game: see encode_game
+        :return: the id of the game
+        '''
+        if self.__games >= self.__chunk_games:
+            self.close()
+            self.__chunk += 1
+            self.__games = 0
+        if self.__data is None:
+            self.__open()
+        offset = self.__data.tell()
+        self.__data.write(encode_game(game))
+        # the record goes first, so an index entry never points past the end of the data
+        self.__data.flush()
+        self.__index.write(offset.to_bytes(8, 'little'))
+        self.__index.flush()
+        self.__games += 1
+        self.__total += 1
+        return self.__total - 1
+
+    def close(self):
+        for file in (self.__data, self.__index):
+            if file is not None:
+                file.close()
+        self.__data = self.__index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class RecordReader:
+    '''
+    Reads the games of a directory of chunk files: all of them as a stream (games, positions), or any one
+    by its id (game)
+    '''
+    def __init__(self, directory, chunk_games = 10000):
+        '''
+        :param chunk_games: the number of games of a chunk file, as it was written
+        '''
+        self.__directory = directory
+        self.__chunk_games = chunk_games
+        self.__indexes = {}
+
+    def __index(self, chunk):
+        if chunk not in self.__indexes:
+            path = _chunk_path(self.__directory, chunk, 'idx')
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return np.zeros(0, dtype = '<u8')
+            self.__indexes[chunk] = np.memmap(path, dtype = '<u8', mode = 'r')
+        return self.__indexes[chunk]
+
+    def __len__(self):
+        chunks = _chunks(self.__directory)
+        if not chunks:
+            return 0
+        return chunks[-1] * self.__chunk_games + len(self.__index(chunks[-1]))
+
+    def game(self, game_id):
+        '''
+        :param game_id: the id the writer gave the game
+        :return: the game (see encode_game)
+        '''
+        chunk, number = divmod(game_id, self.__chunk_games)
+        index = self.__index(chunk)
+        if not 0 <= number < len(index):
+            raise IndexError(f"no game {game_id}")
+        with open(_chunk_path(self.__directory, chunk, 'gmr'), 'rb') as file:
+            file.seek(int(index[number]))
+            # the length of a record takes at most 10 bytes, then the record itself
+            head = file.read(10)
+            length, start = read_varint(head, 0)
+            data = head + file.read(max(0, start + length - len(head)))
+        return decode_game(data)[0]
+
+    def __getitem__(self, game_id):
+        return self.game(game_id)
+
+    def games(self):
+        '''
+        Streams the games, chunk by chunk, a block of a chunk at a time
+        :return: a generator of (game id, game)
+        '''
+        block_size = 1 << 16
+        for chunk in _chunks(self.__directory):
+            game_id = chunk * self.__chunk_games
+            with open(_chunk_path(self.__directory, chunk, 'gmr'), 'rb') as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"chunk {chunk} is not a game record file")
+                data = b''
+                while True:
+                    block = file.read(block_size)
+                    data += block
+                    position = 0
+                    while True:
+                        try:
+                            length, start = read_varint(data, position)
+                        except IndexError:
+                            break
+                        if start + length > len(data):
+                            break
+                        game, position = decode_game(data, position)
+                        yield game_id, game
+                        game_id += 1
+                    data = data[position:]
+                    if not block:
+                        # whatever is left is a record cut short by a crash
+                        break
+
+    def positions(self):
+        '''
+        Streams every position of every game, before each move
+        :return: a generator of (board, row, col, player, winner), the move (row, col) being the one played
+                 by the player; the board is the same object all along a game, copy it to keep it
+        '''
+        for _, game in self.games():
+            board = Board(game['height'], game['width'])
+            for ply, (row, col) in enumerate(game['moves']):
+                yield board, row, col, ply % 2, game['winner']
+                board.add_move(row, col, ply % 2)
@@ -0,0 +1,118 @@
+'''
+Threat-space search: Victory by Continuous Fours (VCF).
+
+The attacker only plays fours, every four leaves the defender a single cell to block, so the tree is
+narrow and a forced win many moves deep is found in a few thousand nodes, where the full-width minimax
+does not get past a handful of plies.
+
+Fives and fours are read off the pattern tables through Board.gain: a stone that completes a five
+gains at least FIVE - FOUR, one that makes a four (a window with 4 stones and no opponent stone) at
+least FOUR - THREE, and no amount of threes and twos adds up to that much.
+'''
+from domain.board import SIDE_KEYS
+from domain.patterns import FIVE, FOUR, THREE
+
+FIVE_GAIN = FIVE - FOUR
+FOUR_GAIN = FOUR - THREE
+
+class ThreatSearch:
+    def __init__(self, board, max_nodes = 20000, max_depth = 30):
+        '''
+        :param board: the board to search (domain.board.Board), every stone tried is taken back
+        :param max_nodes: the node budget of one search
+        :param max_depth: the maximum number of fours in a row
+        '''
+        self.__board = board
+        self.__max_nodes = max_nodes
+        self.__max_depth = max_depth
+        self.__nodes = 0
+        # hashes of the positions (attacker to move) already shown to have no VCF
+        self.__refuted = set()
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    def five_cells(self, player):
+        '''
+        :param player: the player
+        :return: the empty cells where the player completes a five, as (row, col)
+        '''
+        board = self.__board
+        width = board.width
+        return [divmod(index, width) for index in sorted(board.candidates) if board.gain(index // width, index % width, player) >= FIVE_GAIN]
+
+    def four_cells(self, player):
+        '''
+        :param player: the player
+        :return: the empty cells where the player makes a four (or a five), strongest first, as (row, col)
+        '''
+        board = self.__board
+        width = board.width
+        gains = []
+        for index in board.candidates:
+            gain = board.gain(index // width, index % width, player)
+            if gain >= FOUR_GAIN:
+                gains.append((-gain, index))
+        return [divmod(index, width) for _, index in sorted(gains)]
+
+    def vcf(self, player):
+        '''
+        Looks for a win of the player by continuous fours, the player being to move
+        :param player: the attacker
+        :return: the winning sequence (attacker and defender moves, alternating, the five last), None if there is none
+                 (or it is out of the node budget)
+        '''
+        self.__nodes = 0
+        self.__refuted.clear()
+        fives = self.five_cells(player)
+        if fives:
+            return [fives[0]]
+        return self.__search(player, 0)
+
+    def __search(self, player, depth):
+        self.__nodes += 1
+        board = self.__board
+        if depth >= self.__max_depth or self.__nodes > self.__max_nodes:
+            return None
+        key = board.hash ^ SIDE_KEYS[player]
+        if key in self.__refuted:
+            return None
+
+        candidates = self.four_cells(player)
+        threats = self.five_cells(player ^ 1)
+        if len(threats) > 1:
+            return None
+        if threats:
+            # the defender threatens a five: only a four that also blocks it keeps the attack going
+            candidates = [cell for cell in candidates if cell == threats[0]]
+
+        for row, col in candidates:
+            board.make_move(row, col, player)
+            fives = self.five_cells(player)
+            sequence = None
+            if len(fives) > 1:
+                # an open four or a double four, the defender cannot block both
+                sequence = [(row, col), fives[0], fives[1]]
+            elif len(fives) == 1:
+                block_row, block_col = fives[0]
+                board.make_move(block_row, block_col, player ^ 1)
+                if not self.__blocked_with_five(block_row, block_col, player ^ 1):
+                    rest = self.__search(player, depth + 1)
+                    if rest is not None:
+                        sequence = [(row, col), (block_row, block_col)] + rest
+                board.unmake_move()
+            board.unmake_move()
+            if sequence is not None:
+                return sequence
+
+        if self.__nodes <= self.__max_nodes:
+            # a search cut by the budget proves nothing
+            self.__refuted.add(key)
+        return None
+
+    def __blocked_with_five(self, row, col, player):
+        '''
+        :return: True if the stone of the player on (row, col) makes a five
+        '''
+        return any(self.__board.count_line(row, col, direction, player) >= 5 for direction in range(4))
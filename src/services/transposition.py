@@ -0,0 +1,115 @@
+import sys
+
+def _entry_bytes():
+    '''
+    :return: the memory a stored entry takes in CPython: its slot, the tuple, its 64-bit key, its score
+             and its move, the objects rounded up to the 16 bytes the allocator hands out
+    '''
+    objects = ((2 ** 64 - 1, 9, 0, 10 ** 6, (18, 18), 0), 2 ** 64 - 1, 10 ** 6, (18, 18))
+    return 8 + sum((sys.getsizeof(item) + 15) // 16 * 16 for item in objects)
+
+class TranspositionTable:
+    '''
+    A fixed-size transposition table for the minimax search, keyed on the Zobrist hash of the position.
+    Every bucket has two slots: the first one keeps the deepest entry (entries from older searches
+    are always replaced), the second one is always overwritten. The number of buckets follows from
+    the memory cap, so the table never grows past it.
+    '''
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    ENTRY_BYTES = _entry_bytes()
+
+    def __init__(self, memory_mb = 16):
+        self.__buckets = max(1, int(memory_mb * 2 ** 20) // (2 * self.ENTRY_BYTES))
+        self.__slots = [None] * (2 * self.__buckets)
+        self.__generation = 0
+        self.__filled = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def capacity(self):
+        return 2 * self.__buckets
+
+    @property
+    def size(self):
+        return self.__filled
+
+    def new_search(self):
+        '''
+        Ages the table, entries stored by earlier searches become the first to be replaced
+        '''
+        self.__generation += 1
+
+    def clear(self):
+        '''
+        Empties the table and resets the counters
+        '''
+        self.__slots = [None] * (2 * self.__buckets)
+        self.__filled = 0
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def probe(self, key):
+        '''
+        Looks the position up
+        :param key: the hash of the position
+        :return: (depth, bound type, score, best move) if the position is stored, None otherwise
+        '''
+        index = key % self.__buckets * 2
+        for slot in (index, index + 1):
+            entry = self.__slots[slot]
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1], entry[2], entry[3], entry[4]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        '''
+        Stores the result of a search
+        :param key: the hash of the position
+        :param depth: the depth the position was searched to
+        :param bound: EXACT, LOWER or UPPER
+        :param score: the score of the position
+        :param move: the best move found, None if there is none
+        '''
+        index = key % self.__buckets * 2
+        entry = (key, depth, bound, score, move, self.__generation)
+        first = self.__slots[index]
+        second = self.__slots[index + 1]
+        self.stores += 1
+
+        if first is None or first[0] == key or depth >= first[1] or first[5] != self.__generation:
+            if first is None:
+                self.__filled += 1
+            elif first[0] != key:
+                self.overwrites += 1
+            self.__slots[index] = entry
+            if second is not None and second[0] == key:
+                self.__slots[index + 1] = None
+                self.__filled -= 1
+        else:
+            if second is None:
+                self.__filled += 1
+            elif second[0] != key:
+                self.overwrites += 1
+            self.__slots[index + 1] = entry
+
+    def stats(self):
+        '''
+        :return: the hit/miss counters and the fill of the table, as a dict
+        '''
+        probes = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'size': self.__filled,
+            'capacity': self.capacity
+        }
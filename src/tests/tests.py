@@ -1,13 +1,33 @@
 import sys
 import os
 import unittest
+import random
+import tempfile
+import io
+import json
+import time
+import tracemalloc
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.game import Game
 import numpy as np
-from domain.board import Board
+from domain.board import Board, transform
+from domain.patterns import ONE, TWO, FIVE
 from services.ai import AI
+from services.transposition import TranspositionTable
+from services.parallel import speedup_report
+from services import benchmark
+from services.background import BackgroundSearch
+from services.threats import ThreatSearch
+from services.mcts import MCTS
+from services.book import OpeningBook, BookBuilder
+from services.eval_cache import EvaluationCache
+from services.instrumentation import SearchStats, aggregate, load
+from services.records import RecordWriter, RecordReader, encode_game, decode_game
+from services.protocol import PiskvorkEngine
+from services import batch_eval
+from services.arena import Arena, create_engine, play_game, elo_difference, MinimaxEngine, MctsEngine, ProtocolEngine
 
 class TestGame(unittest.TestCase):
     def setUp(self):
@@ -19,6 +39,12 @@ class TestGame(unittest.TestCase):
         self.assertEqual(self.game.player, 0)
         self.assertEqual(self.game.game_over, False)
 
+    def test_board_size(self):
+        game = Game(19, 30)
+        self.assertEqual((game.board_height, game.board_width), (19, 30))
+        self.assertTrue(game.is_valid_move(18, 29))
+        self.assertFalse(game.is_valid_move(19, 29))
+
     def test_change_player(self):
         self.game.change_player()
         self.assertEqual(self.game.player, 1)
@@ -33,6 +59,20 @@ class TestGame(unittest.TestCase):
         self.game.remove_move(0, 0)
         self.assertEqual(self.game.board[0][0], -1)
 
+    def test_undo_redo(self):
+        self.assertIsNone(self.game.undo_move())
+        for col in range(4):
+            self.game.add_specific_move(7, col, 0)
+            self.game.add_specific_move(8, col, 1)
+        self.game.add_specific_move(7, 4, 0)
+        self.assertEqual(self.game.undo_move(), (7, 4, 0))
+        self.assertEqual(self.game.player, 0)
+        self.assertEqual(self.game.redo_move(), (7, 4, 0))
+        self.assertTrue(self.game.game_over)
+        self.assertEqual(self.game.player, 0)
+        self.assertIsNone(self.game.redo_move())
+        self.assertEqual(self.game.last_move, (7, 4))
+
     def test_has_nearby_moves(self):
         self.game.add_specific_move(0, 0, 1)
         self.assertTrue(self.game.has_nearby_moves(0, 1))
@@ -49,6 +89,42 @@ class TestGame(unittest.TestCase):
             self.game.add_specific_move(0, _, 0)
         self.assertTrue(self.game.search_blocking_move())
 
+    def test_is_winner_inner_stone(self):
+        for col in (3, 4, 6, 7):
+            self.game.add_specific_move(2, col, 0)
+        self.assertFalse(self.game.is_winner(2, 3, 0))
+        self.game.add_specific_move(2, 5, 0)
+        self.assertTrue(self.game.is_winner(2, 5, 0))
+        self.assertTrue(self.game.game_over)
+
+    def test_is_winner_gap(self):
+        for col in range(4):
+            self.game.add_specific_move(2, col, 0)
+        self.game.add_specific_move(2, 7, 0)
+        self.assertFalse(self.game.is_winner(2, 3, 0))
+
+    def test_threat_cells_match_cell_by_cell_scan(self):
+        generator = random.Random(3)
+        for _ in range(10):
+            game = Game()
+            for _ in range(generator.randint(5, 90)):
+                row, col = generator.randrange(15), generator.randrange(15)
+                if game.is_valid_move(row, col):
+                    game.add_specific_move(row, col, generator.randrange(2))
+            for player in (0, 1):
+                wins = np.zeros((15, 15), dtype = bool)
+                threats = np.zeros((15, 15), dtype = bool)
+                for row in range(15):
+                    for col in range(15):
+                        if game.is_valid_move(row, col):
+                            game.add_specific_move(row, col, player)
+                            wins[row, col] = game.is_winner(row, col, player)
+                            threats[row, col] = game.check_four_threat(row, col, player)
+                            game.remove_move(row, col)
+                            game.game_over = False
+                np.testing.assert_array_equal(game.winning_cells(player), wins)
+                np.testing.assert_array_equal(game.four_threat_cells(player), threats)
+
     def test_search_nearby_move(self):
         self.game.add_specific_move(0, 0, 1)
         self.assertTrue(self.game.search_nearby_move())
@@ -83,7 +159,251 @@ class TestBoard(unittest.TestCase):
         self.board.add_move(0, 0, 1)
         self.board.remove_move(0, 0)
         self.assertEqual(self.board.element(0, 0), -1)
-        
+
+    def test_board_view(self):
+        self.board.add_move(2, 3, 0)
+        self.assertEqual(self.board.board[2][3], 0)
+        self.board.remove_move(2, 3)
+        self.assertEqual(self.board.board[2][3], -1)
+        self.assertEqual(self.board.move_count, 0)
+
+    def test_count_line(self):
+        for col in range(4):
+            self.board.add_temp_move(3, col, 1)
+        self.assertEqual(self.board.count_line(3, 0, 0, 1), 4)
+        self.assertEqual(self.board.count_line(3, 0, 1, 1), 1)
+        self.assertEqual(self.board.count_line(3, 5, 0, 1), 0)
+
+    def test_window(self):
+        self.board.add_temp_move(3, 1, 1)
+        self.board.add_temp_move(3, 3, 0)
+        zeros, ones, walls = self.board.window(3, 1, 0)
+        self.assertEqual(ones, 0b000010000)
+        self.assertEqual(zeros, 0b001000000)
+        self.assertEqual(walls, 0b000000111)
+
+    def test_has_five(self):
+        for k in range(4):
+            self.board.add_temp_move(k, 14, 0)
+        self.board.add_temp_move(4, 0, 0)
+        self.assertFalse(self.board.has_five(0))
+        self.board.add_temp_move(4, 14, 0)
+        self.assertTrue(self.board.has_five(0))
+        self.assertFalse(self.board.has_five(1))
+
+    def test_hash(self):
+        self.board.add_temp_move(7, 7, 0)
+        self.board.add_temp_move(7, 8, 1)
+        first = self.board.hash
+        self.board.remove_move(7, 7)
+        self.board.remove_move(7, 8)
+        self.assertEqual(self.board.hash, 0)
+        self.board.add_temp_move(7, 8, 1)
+        self.board.add_temp_move(7, 7, 0)
+        self.assertEqual(self.board.hash, first)
+        self.assertNotEqual(Board().hash ^ first, 0)
+
+    def test_candidates(self):
+        self.board.add_temp_move(0, 0, 0)
+        self.assertEqual(self.board.candidates, {1, 15, 16})
+        self.board.add_temp_move(0, 1, 1)
+        self.assertEqual(self.board.candidates, {2, 15, 16, 17})
+        self.board.remove_move(0, 0)
+        self.assertEqual(self.board.candidates, {0, 2, 15, 16, 17})
+        self.board.remove_move(0, 1)
+        self.assertEqual(self.board.candidates, set())
+
+    def test_ordered_candidates(self):
+        self.board.add_temp_move(7, 7, 0)
+        moves = self.board.ordered_candidates(6, 6)
+        self.assertEqual(moves[0], (6, 6))
+        self.assertEqual(len(moves), 8)
+
+    def test_score(self):
+        self.board.add_temp_move(7, 7, 0)
+        self.assertEqual(self.board.score(0), 4 * 5 * ONE)
+        self.board.add_temp_move(7, 8, 0)
+        self.assertEqual(self.board.score(0), 4 * TWO + 3 * 5 * ONE * 2 + 2 * ONE)
+        self.board.add_temp_move(7, 9, 1)
+        self.board.remove_move(7, 9)
+        self.board.remove_move(7, 8)
+        self.assertEqual(self.board.score(0), 4 * 5 * ONE)
+        self.assertEqual(self.board.score(1), 0)
+
+    def test_score_five(self):
+        for col in range(5):
+            self.board.add_temp_move(0, col, 1)
+        self.assertGreaterEqual(self.board.score(1), FIVE)
+
+    def test_gain(self):
+        self.board.add_temp_move(7, 7, 0)
+        score = self.board.score(0)
+        gain = self.board.gain(7, 8, 0)
+        self.board.add_temp_move(7, 8, 0)
+        self.assertEqual(self.board.score(0), score + gain)
+
+    def test_make_unmake(self):
+        self.board.make_move(7, 7, 0)
+        state = (self.board.hash, set(self.board.candidates), self.board.score(0), self.board.score(1))
+        for row, col, player in [(7, 8, 1), (6, 6, 0), (8, 8, 1)]:
+            self.board.make_move(row, col, player)
+        self.assertEqual(self.board.last_move, (8, 8))
+        self.assertEqual(self.board.unmake_move(), (8, 8, 1))
+        self.assertEqual(self.board.last_move, (6, 6))
+        self.board.unmake_move()
+        self.board.unmake_move()
+        self.assertEqual(self.board.last_move, (7, 7))
+        self.assertEqual((self.board.hash, self.board.candidates, self.board.score(0), self.board.score(1)), state)
+        self.assertEqual(self.board.history, [(7, 7, 0)])
+
+    def test_redo(self):
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (6, 6, 0)]:
+            self.board.make_move(row, col, player)
+        self.board.unmake_move()
+        self.board.unmake_move()
+        self.assertEqual(self.board.redo_count, 2)
+        self.assertEqual(self.board.redo_move(), (7, 8, 1))
+        self.assertEqual(self.board.last_move, (7, 8))
+        # a new move drops the moves that were undone
+        self.board.make_move(9, 9, 0)
+        self.assertEqual(self.board.redo_count, 0)
+        self.assertIsNone(self.board.redo_move())
+        self.assertEqual(self.board.history, [(7, 7, 0), (7, 8, 1), (9, 9, 0)])
+
+    def test_remove_earlier_move(self):
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (6, 6, 0)]:
+            self.board.make_move(row, col, player)
+        self.board.remove_move(7, 8)
+        self.assertEqual(self.board.history, [(7, 7, 0), (6, 6, 0)])
+        self.assertEqual(self.board.last_move, (6, 6))
+        self.assertEqual(self.board.copy().history, self.board.history)
+        self.assertEqual(self.board.copy().hash, self.board.hash)
+
+    def test_canonical_hash(self):
+        moves = [(7, 7, 0), (6, 8, 1), (5, 5, 0)]
+        for row, col, player in moves:
+            self.board.add_temp_move(row, col, player)
+        key, _ = self.board.canonical_hash()
+        for symmetry in range(8):
+            board = Board()
+            for row, col, player in moves:
+                board.add_temp_move(*transform(symmetry, row, col, 15, 15), player)
+            self.assertEqual(board.canonical_hash()[0], key)
+
+class TestBatchEvaluation(unittest.TestCase):
+    def test_scores(self):
+        generator = random.Random(3)
+        boards = []
+        for _ in range(20):
+            board = Board()
+            for move in range(generator.randint(0, 60)):
+                row, col = generator.randrange(15), generator.randrange(15)
+                if board.element(row, col) == -1:
+                    board.add_move(row, col, move % 2)
+            boards.append(board)
+        scores = batch_eval.scores(batch_eval.stack(boards))
+        self.assertEqual(scores.tolist(), [[board.score(0), board.score(1)] for board in boards])
+
+    def test_window_counts(self):
+        board = Board(5, 5)
+        for col in range(5):
+            board.add_move(2, col, 1)
+        counts = batch_eval.window_counts(batch_eval.stack([board]))
+        self.assertEqual(counts[0, 1, 5], 1)
+        # the row blocks both the columns and the diagonals of player 0
+        self.assertEqual(counts[0, 0].sum(), 4)
+
+    def test_evaluate(self):
+        ais = [benchmark.load_ai(name) for name in benchmark.POSITIONS]
+        values = batch_eval.evaluate(np.stack([ai.board for ai in ais]))
+        self.assertEqual(values.tolist(), [ai.evaluate_position() for ai in ais])
+
+class TestTranspositionTable(unittest.TestCase):
+    def setUp(self):
+        self.table = TranspositionTable(memory_mb = 0.001)
+
+    def test_store_probe(self):
+        self.assertIsNone(self.table.probe(42))
+        self.table.store(42, 3, TranspositionTable.EXACT, 10, (1, 2))
+        self.assertEqual(self.table.probe(42), (3, TranspositionTable.EXACT, 10, (1, 2)))
+        self.assertEqual(self.table.hits, 1)
+        self.assertEqual(self.table.misses, 1)
+
+    def test_depth_preferred_replacement(self):
+        buckets = self.table.capacity // 2
+        self.table.store(1, 5, TranspositionTable.EXACT, 1, None)
+        self.table.store(1 + buckets, 2, TranspositionTable.EXACT, 2, None)
+        self.table.store(1 + 2 * buckets, 1, TranspositionTable.EXACT, 3, None)
+        self.assertIsNotNone(self.table.probe(1))
+        self.assertIsNone(self.table.probe(1 + buckets))
+        self.assertIsNotNone(self.table.probe(1 + 2 * buckets))
+        self.table.new_search()
+        self.table.store(1 + buckets, 2, TranspositionTable.EXACT, 2, None)
+        self.assertIsNone(self.table.probe(1))
+        self.assertLessEqual(self.table.size, self.table.capacity)
+
+    def test_memory_cap(self):
+        generator = random.Random(3)
+        tracemalloc.start()
+        try:
+            table = TranspositionTable(memory_mb = 1)
+            for _ in range(4 * table.capacity):
+                move = (generator.randrange(19), generator.randrange(19))
+                table.store(generator.getrandbits(64), generator.randint(1, 9), TranspositionTable.EXACT, generator.randint(-10 ** 6, 10 ** 6), move)
+            used = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(table.size, 0.9 * table.capacity)
+        self.assertLess(used, 2 ** 20)
+
+class TestEvaluationCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.bin')
+        self.cache = EvaluationCache(self.path, 0.001)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_probe(self):
+        self.assertIsNone(self.cache.probe(12345))
+        self.cache.store(12345, 3, TranspositionTable.LOWER, -250)
+        self.assertEqual(self.cache.probe(12345), (3, TranspositionTable.LOWER, -250))
+        # a shallower result does not replace a deeper one
+        self.cache.store(12345, 2, TranspositionTable.EXACT, 0)
+        self.assertEqual(self.cache.probe(12345)[0], 3)
+        self.cache.flush()
+        self.assertEqual(EvaluationCache(self.path).probe(12345), (3, TranspositionTable.LOWER, -250))
+        self.assertEqual(self.cache.stats()['size'], 1)
+
+    def test_eviction(self):
+        buckets = self.cache.capacity // EvaluationCache.BUCKET
+        for depth in range(EvaluationCache.BUCKET + 1):
+            self.cache.store(1 + depth * buckets, depth + 2, TranspositionTable.EXACT, depth)
+        # the bucket was full, the shallowest entry made room
+        self.assertIsNone(self.cache.probe(1))
+        self.assertIsNotNone(self.cache.probe(1 + EvaluationCache.BUCKET * buckets))
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_invalid_file_ignored(self):
+        self.cache.store(12345, 3, TranspositionTable.EXACT, 7)
+        self.cache.flush()
+        with open(self.path, 'r+b') as file:
+            file.seek(4)
+            file.write(b'\x09')
+        cache = EvaluationCache(self.path)
+        self.assertFalse(cache.valid)
+        self.assertIsNone(cache.probe(12345))
+        cache.store(12345, 3, TranspositionTable.EXACT, 7)
+
+    def test_ai_cache(self):
+        first = benchmark.load_ai('midgame_cluster', cache = self.cache)
+        move = first.computer_move(3)
+        second = benchmark.load_ai('midgame_cluster', cache = EvaluationCache(self.path))
+        self.assertEqual(second.computer_move(3), move)
+        self.assertLess(second.nodes, first.nodes)
+        self.assertGreater(second.evaluation_cache.hits, 0)
+
 class TestAI(unittest.TestCase):
     def setUp(self):
         self.ai = AI()
@@ -94,10 +414,55 @@ class TestAI(unittest.TestCase):
         self.assertEqual(self.ai.player, 0)
         self.assertEqual(self.ai.game_over, False)
 
+    def test_board_size(self):
+        ai = AI(height = 19, width = 19)
+        self.assertEqual(ai.generate_moves(), [(9, 9)])
+        for row, col, player in [(9, 9, 0), (9, 10, 1), (10, 10, 0)]:
+            ai.add_move(row, col, player)
+        self.assertTrue(ai.is_valid_move(*ai.computer_move(2)))
+
     def test_change_player(self):
         self.ai.change_player()
         self.assertEqual(self.ai.player, 1)
 
+    def test_ponder_hit(self):
+        ai = benchmark.load_ai('midgame_cluster')
+        ai.add_move(*ai.computer_move(3), ai.COMPUTER)
+        reply = ai.predicted_replies(2)[0]
+        ai.ponder(replies = 2, max_depth = 3)
+        while ai.pondering:
+            time.sleep(0.01)
+        ai.add_move(*reply, ai.PLAYER)
+        move = ai.computer_move(3)
+        self.assertTrue(ai.ponder_hit)
+        self.assertEqual(ai.nodes, 0)
+        self.assertTrue(ai.is_valid_move(*move))
+
+    def test_ponder_stop(self):
+        ai = benchmark.load_ai('midgame_spread')
+        ai.add_move(*ai.computer_move(2), ai.COMPUTER)
+        history = ai.board_copy().history
+        ai.ponder(replies = 3)
+        self.assertTrue(ai.pondering)
+        ai.stop_pondering()
+        self.assertFalse(ai.pondering)
+        self.assertEqual(ai.board_copy().history, history)
+        # a reply that was not predicted is searched as usual
+        ai.add_move(0, 0, ai.PLAYER)
+        self.assertTrue(ai.is_valid_move(*ai.computer_move(2)))
+        self.assertFalse(ai.ponder_hit)
+
+    def test_undo_redo(self):
+        self.ai.add_move(7, 7, self.ai.PLAYER)
+        self.ai.change_player()
+        self.ai.add_move(*self.ai.computer_move(2), self.ai.COMPUTER)
+        history = self.ai.board_copy().history
+        self.assertEqual(self.ai.undo_move()[2], self.ai.COMPUTER)
+        self.assertEqual(self.ai.player, self.ai.COMPUTER)
+        self.assertEqual(self.ai.redo_move(), history[-1])
+        self.assertEqual(self.ai.player, self.ai.PLAYER)
+        self.assertEqual(self.ai.last_move, history[-1][:2])
+
     def test_is_valid_move(self):
         self.assertTrue(self.ai.is_valid_move(0, 0))
         self.assertFalse(self.ai.is_valid_move(15, 15))
@@ -110,6 +475,29 @@ class TestAI(unittest.TestCase):
         self.ai.add_move(0, 1)
         self.assertIn((0, 2), self.ai.generate_moves())
 
+    def test_generate_moves_no_duplicates(self):
+        self.assertEqual(self.ai.generate_moves(), [(7, 7)])
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0)]:
+            self.ai.add_move(row, col, player)
+        moves = self.ai.generate_moves()
+        self.assertEqual(len(moves), len(set(moves)))
+        self.assertEqual(len(moves), 12)
+        self.assertTrue(all(self.ai.is_valid_move(row, col) for row, col in moves))
+
+    def test_evaluate_position(self):
+        self.ai.add_move(7, 7, self.ai.COMPUTER)
+        self.assertGreater(self.ai.evaluate_position(), 0)
+        self.ai.add_move(0, 0, self.ai.PLAYER)
+        self.ai.add_move(0, 1, self.ai.PLAYER)
+        self.ai.add_move(0, 2, self.ai.PLAYER)
+        self.assertLess(self.ai.evaluate_position(), 0)
+
+    def test_computer_move_takes_win(self):
+        for col in range(4):
+            self.ai.add_move(7, col + 3, self.ai.COMPUTER)
+        self.ai.add_move(0, 0, self.ai.PLAYER)
+        self.assertIn(self.ai.computer_move(2), [(7, 2), (7, 7)])
+
     def test_get_neighbors(self):
         self.assertIn((0, 1), self.ai.get_neighbors(0, 0))
 
@@ -122,6 +510,529 @@ class TestAI(unittest.TestCase):
         self.assertEqual(self.ai.board[0][0], 0)
         self.ai.remove_move(0, 0)
         self.assertEqual(self.ai.board[0][0], -1)
-        
+
+    def test_is_winning_move(self):
+        for k in range(5):
+            self.ai.add_temp_move(k, k, self.ai.COMPUTER)
+        self.assertTrue(self.ai.is_winning_move(2, 2, self.ai.COMPUTER))
+        self.assertFalse(self.ai.is_winning_move(2, 2, self.ai.PLAYER))
+        self.ai.remove_move(4, 4)
+        self.assertFalse(self.ai.is_winning_move(2, 2, self.ai.COMPUTER))
+
+    def test_minimax_transposition_table(self):
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0), (6, 6, 1)]:
+            self.ai.add_move(row, col, player)
+        score, _ = self.ai.minimax(3, self.ai.COMPUTER, float('-inf'), float('inf'))
+        self.assertGreater(self.ai.transposition_table.size, 0)
+        # a second search of the same position is answered from the table
+        self.assertEqual(self.ai.minimax(3, self.ai.COMPUTER, float('-inf'), float('inf'))[0], score)
+        self.assertGreater(self.ai.transposition_table.hits, 0)
+
+    def test_negamax_pvs(self):
+        for name in ('midgame_cluster', 'tactical_block_four', 'tactical_open_three'):
+            plain = benchmark.load_ai(name)
+            score, _ = plain.minimax(3, plain.COMPUTER, float('-inf'), float('inf'), True, plain.last_move)
+            pvs = benchmark.load_ai(name)
+            # the null windows change how much is searched, not the score
+            self.assertEqual(pvs.negamax(3, pvs.COMPUTER, float('-inf'), float('inf'), pvs.last_move)[0], score)
+
+    def test_aspiration_search(self):
+        ai = benchmark.load_ai('midgame_spread')
+        score, _ = ai.aspiration_search(2)
+        # a window that is too high fails low and is searched again with the full window
+        full, _ = benchmark.load_ai('midgame_spread').aspiration_search(3)
+        self.assertEqual(ai.aspiration_search(3, score + 10 * ai.ASPIRATION_WINDOW)[0], full)
+
+    def test_order_moves(self):
+        for col in range(3):
+            self.ai.add_move(7, col + 5, self.ai.PLAYER)
+        self.ai.add_move(9, 9, self.ai.COMPUTER)
+        # the ends of the open three go first
+        self.assertIn(self.ai.order_moves(self.ai.generate_moves(), self.ai.COMPUTER)[0], [(7, 4), (7, 8)])
+        self.assertEqual(self.ai.order_moves(self.ai.generate_moves(), self.ai.COMPUTER, tt_move = (9, 10))[0], (9, 10))
+
+    def test_record_cutoff(self):
+        self.ai.add_move(7, 7, self.ai.PLAYER)
+        self.ai.record_cutoff((5, 5), self.ai.COMPUTER, 3, 1)
+        self.ai.record_cutoff((6, 6), self.ai.COMPUTER, 3, 1)
+        # both killers of the ply go before the other quiet moves
+        self.assertEqual(set(self.ai.order_moves(self.ai.generate_moves() + [(5, 5)], self.ai.COMPUTER, 1)[:2]), {(5, 5), (6, 6)})
+        self.assertNotIn((5, 5), self.ai.order_moves(self.ai.generate_moves() + [(5, 5)], self.ai.COMPUTER, 2)[:1])
+
+    def test_computer_move_iterative_deepening(self):
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0)]:
+            self.ai.add_move(row, col, player)
+        move = self.ai.computer_move(2)
+        self.assertTrue(self.ai.is_valid_move(*move))
+        self.assertEqual(self.ai.completed_depth, 2)
+        self.assertEqual(self.ai.principal_variation[0], move)
+
+    def test_computer_move_time_limit(self):
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0), (6, 6, 1), (9, 9, 0)]:
+            self.ai.add_move(row, col, player)
+        board = self.ai.board.copy()
+        move = self.ai.computer_move(None, time_limit_ms = 50)
+        self.assertTrue(self.ai.is_valid_move(*move))
+        self.assertGreaterEqual(self.ai.completed_depth, 1)
+        # the aborted iteration leaves the board as it was
+        np.testing.assert_array_equal(self.ai.board, board)
+
+    def test_search_winning_move(self):
+        for col in range(4):
+            self.ai.add_move(5, col, self.ai.COMPUTER)
+        self.assertEqual(self.ai.search_winning_move(), (5, 4))
+        self.assertEqual(self.ai.board[5][4], -1)
+
+    def test_search_blocking_move(self):
+        for col in range(1, 5):
+            self.ai.add_move(5, col, self.ai.PLAYER)
+        self.assertEqual(self.ai.search_blocking_move(), (5, 0))
+        self.assertEqual(self.ai.board[5][0], -1)
+
+
+class TestSearchStats(unittest.TestCase):
+    def setUp(self):
+        self.ai = benchmark.load_ai('midgame_cluster')
+
+    def test_record(self):
+        output = io.StringIO()
+        stats = SearchStats(output, {'position': 'midgame_cluster'})
+        self.ai.instrument(stats)
+        move = self.ai.computer_move(3)
+        record = json.loads(output.getvalue())
+        self.assertEqual(record, stats.records[0])
+        self.assertEqual(record['position'], 'midgame_cluster')
+        self.assertEqual(record['move'], list(move))
+        self.assertEqual(record['nodes'], self.ai.nodes)
+        self.assertEqual([iteration['depth'] for iteration in record['iterations']], [1, 2, 3])
+        self.assertEqual(sum(record['cutoffs_by_index']), record['beta_cutoffs'])
+        self.assertEqual(record['leaf_evaluations'], record['phases']['evaluate_position']['calls'])
+        self.assertGreater(record['tt_probes'], 0)
+
+    def test_detach(self):
+        self.ai.instrument(SearchStats())
+        self.ai.instrument(None)
+        self.assertFalse(set(vars(self.ai)) & set(SearchStats.PHASES + ('computer_move',)))
+        self.ai.computer_move(2)
+
+    def test_profile(self):
+        for profile in ('cprofile', 'sample'):
+            ai = benchmark.load_ai('midgame_spread')
+            stats = SearchStats(profile = profile, sample_interval_ms = 0.1)
+            ai.instrument(stats)
+            ai.computer_move(3)
+            self.assertTrue(stats.records[0]['profile'])
+        self.assertRaises(ValueError, SearchStats, profile = 'unknown')
+
+    def test_aggregate(self):
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'trace.jsonl')
+        stats = SearchStats(path)
+        self.ai.instrument(stats)
+        self.ai.computer_move(2)
+        self.ai.computer_move(3)
+        records = load(path)
+        directory.cleanup()
+        summary = aggregate(records)
+        self.assertEqual(summary['searches'], 2)
+        self.assertEqual(summary['nodes'], sum(record['nodes'] for record in records))
+        self.assertEqual(summary['mean_depth'], 2.5)
+        # aggregates add up like the records
+        self.assertEqual(aggregate([summary, summary])['nodes'], 2 * summary['nodes'])
+
+class TestThreatSearch(unittest.TestCase):
+    def setUp(self):
+        self.board = Board()
+        for row, col, player in [
+            (7, 7, 0), (6, 6, 1), (6, 8, 0), (5, 6, 1), (4, 5, 0), (3, 5, 1), (6, 9, 0), (6, 7, 1),
+            (6, 5, 0), (5, 5, 1), (3, 6, 0), (5, 4, 1), (2, 5, 0), (4, 6, 1), (5, 3, 0)
+        ]:
+            self.board.add_move(row, col, player)
+        self.threats = ThreatSearch(self.board)
+
+    def test_five_and_four_cells(self):
+        self.assertEqual(self.threats.five_cells(1), [])
+        self.assertIn((5, 7), self.threats.four_cells(1))
+
+    def test_vcf(self):
+        hash = self.board.hash
+        sequence = self.threats.vcf(1)
+        self.assertEqual(len(sequence), 7)
+        self.assertEqual(self.board.hash, hash)
+        # every four leaves a single block but the last one, and the last move is a five
+        for index, (row, col) in enumerate(sequence):
+            if index % 2 == 1 and index < len(sequence) - 2:
+                self.assertEqual(self.threats.five_cells(1), [(row, col)])
+            self.board.add_temp_move(row, col, 1 if index % 2 == 0 else 0)
+        self.assertTrue(self.board.has_five(1))
+
+    def test_no_vcf(self):
+        self.assertIsNone(self.threats.vcf(0))
+
+    def test_tactical_move(self):
+        self.assertIn(benchmark.load_ai('tactical_block_four').tactical_move(), [(7, 3), (7, 8)])
+        self.assertIn(benchmark.load_ai('tactical_win').tactical_move(), [(7, 4), (7, 9)])
+        self.assertIsNone(benchmark.load_ai('opening_diagonal').tactical_move())
+
+class TestMCTS(unittest.TestCase):
+    def load(self, name, **options):
+        mcts = MCTS(**options)
+        for row, col, player in benchmark.POSITIONS[name]['moves']:
+            mcts.add_move(row, col, player)
+        return mcts
+
+    def test_computer_move_takes_win(self):
+        self.assertIn(self.load('tactical_win').computer_move(300), [(7, 4), (7, 9)])
+
+    def test_computer_move_blocks(self):
+        mcts = MCTS()
+        for row, col, player in [(7, 4, 0), (7, 3, 1), (7, 5, 0), (6, 5, 1), (7, 6, 0), (8, 8, 1), (7, 7, 0)]:
+            mcts.add_move(row, col, player)
+        self.assertEqual(mcts.computer_move(300), (7, 8))
+        self.assertEqual(mcts.nodes, 300)
+
+    def test_tree_reuse(self):
+        mcts = self.load('opening_diagonal')
+        row, col = mcts.computer_move(200)
+        mcts.add_move(row, col, mcts.COMPUTER)
+        self.assertGreater(mcts.tree_size, 0)
+        mcts.add_move(0, 0, mcts.PLAYER)
+        self.assertEqual(mcts.tree_size, 0)
+
+    def test_threads_time_limit(self):
+        mcts = self.load('midgame_cluster', threads = 3)
+        move = mcts.computer_move(None, 100)
+        self.assertTrue(mcts.is_valid_move(*move))
+        self.assertGreater(mcts.nodes, 0)
+
+class TestOpeningBook(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'book.bin')
+        builder = BookBuilder(max_moves = 4)
+        builder.add_game([(7, 7), (6, 8), (5, 5), (8, 6)], 1)
+        builder.add_game([(7, 7), (6, 8), (5, 5), (9, 9)], 0)
+        builder.save(self.path)
+        self.book = OpeningBook(self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replies(self):
+        self.assertEqual(self.book.size, 4)
+        board = Board()
+        for row, col, player in [(7, 7, 0), (6, 8, 1), (5, 5, 0)]:
+            board.add_move(row, col, player)
+        self.assertEqual(self.book.replies(board), [(8, 6, 2)])
+        # the same position, mirrored
+        board = Board()
+        for row, col, player in [(7, 7, 0), (6, 6, 1), (5, 9, 0)]:
+            board.add_move(row, col, player)
+        self.assertEqual(self.book.move(board), (8, 8))
+        board.add_move(8, 8, 1)
+        self.assertIsNone(self.book.move(board))
+
+    def test_extend(self):
+        builder = BookBuilder(max_moves = 4)
+        builder.add_book(self.path)
+        builder.add_game([(7, 7), (6, 8), (5, 5), (8, 6)], 1)
+        builder.save(self.path)
+        self.assertEqual(OpeningBook(self.path).size, 4)
+
+    def test_invalid(self):
+        with open(self.path, 'r+b') as file:
+            file.write(b'XXXX')
+        self.assertRaises(ValueError, OpeningBook(self.path).move, Board())
+
+    def test_ai_book_move(self):
+        ai = AI(book = self.book)
+        ai.add_move(7, 7, ai.PLAYER)
+        self.assertEqual(ai.computer_move(), (6, 8))
+        self.assertEqual(ai.nodes, 0)
+
+    def test_ai_moving_first(self):
+        # the AI plays colour 1 even when it moves first, it gets the replies of the first player
+        ai = AI(book = self.book)
+        self.assertEqual(ai.computer_move(), (7, 7))
+        self.assertEqual(ai.nodes, 0)
+        builder = BookBuilder(max_moves = 3)
+        builder.add_game([(7, 8), (7, 7), (3, 3)], 0)
+        builder.save(self.path)
+        ai = AI(book = OpeningBook(self.path))
+        ai.add_move(7, 7, ai.COMPUTER)
+        ai.add_move(7, 8, ai.PLAYER)
+        # (3, 3) was the reply of the side that owns (7, 8), not of the AI
+        self.assertNotEqual(ai.computer_move(2), (3, 3))
+        self.assertGreater(ai.nodes, 0)
+
+class TestGameRecords(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.games = [
+            {'height': 15, 'width': 15, 'first': 'minimax:depth=2', 'second': 'heuristic', 'winner': 0,
+             'moves': [[7, 7], [6, 8], [7, 8], [0, 0], [7, 9], [14, 14], [7, 10], [1, 1], [7, 11]]},
+            {'height': 19, 'width': 19, 'first': 'mcts', 'second': '', 'winner': None, 'moves': [[18, 18], [9, 9]]},
+            {'height': 15, 'width': 15, 'first': 'heuristic', 'second': 'mcts', 'winner': 1, 'moves': []}
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_encode(self):
+        record = encode_game(self.games[0])
+        self.assertEqual(decode_game(record), (self.games[0], len(record)))
+        # 9 moves of 15x15: 2 bytes at most each
+        self.assertLess(len(record), 60)
+
+    def test_write_read(self):
+        with RecordWriter(self.directory.name, chunk_games = 2) as writer:
+            self.assertEqual([writer.write(game) for game in self.games], [0, 1, 2])
+        # appending goes on after the games already there
+        with RecordWriter(self.directory.name, chunk_games = 2) as writer:
+            self.assertEqual(writer.write(self.games[1]), 3)
+        reader = RecordReader(self.directory.name, chunk_games = 2)
+        self.assertEqual(len(reader), 4)
+        self.assertEqual(list(reader.games()), list(enumerate(self.games + [self.games[1]])))
+        self.assertEqual(reader[2], self.games[2])
+        self.assertEqual(reader.game(1), self.games[1])
+        self.assertRaises(IndexError, reader.game, 4)
+
+    def test_positions(self):
+        with RecordWriter(self.directory.name) as writer:
+            writer.write(self.games[0])
+        positions = RecordReader(self.directory.name).positions()
+        board, row, col, player, winner = next(positions)
+        self.assertEqual((board.move_count, row, col, player, winner), (0, 7, 7, 0, 0))
+        for board, row, col, player, winner in positions:
+            if board.move_count == 8:
+                self.assertEqual((row, col, player), (7, 11, 0))
+                self.assertEqual(board.count_line(7, 10, 0, 0), 4)
+
+    def test_truncated(self):
+        with RecordWriter(self.directory.name) as writer:
+            writer.write(self.games[0])
+            writer.write(self.games[1])
+        path = os.path.join(self.directory.name, 'games-00000.gmr')
+        with open(path, 'r+b') as file:
+            file.truncate(os.path.getsize(path) - 1)
+        self.assertEqual(list(RecordReader(self.directory.name).games()), [(0, self.games[0])])
+
+    def test_crash_then_append(self):
+        with RecordWriter(self.directory.name) as writer:
+            writer.write(self.games[0])
+            writer.write(self.games[1])
+        # a crash in the middle of the third game: part of its record, and of its index entry
+        with open(os.path.join(self.directory.name, 'games-00000.gmr'), 'ab') as file:
+            file.write(encode_game(self.games[0])[:6])
+        with open(os.path.join(self.directory.name, 'games-00000.idx'), 'ab') as file:
+            file.write(b'\x00\x01\x02')
+        with RecordWriter(self.directory.name) as writer:
+            self.assertEqual(writer.write(self.games[1]), 2)
+        reader = RecordReader(self.directory.name)
+        games = list(reader.games())
+        self.assertEqual(games, [(0, self.games[0]), (1, self.games[1]), (2, self.games[1])])
+        self.assertEqual(len(reader), 3)
+        for game_id, game in games:
+            self.assertEqual(reader.game(game_id), game)
+
+class TestPiskvorkEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = PiskvorkEngine()
+
+    def test_start_begin_turn(self):
+        self.assertEqual(self.engine.handle('BEGIN'), ['ERROR no START yet'])
+        self.assertEqual(self.engine.handle('INFO timeout_turn 200'), [])
+        self.assertEqual(self.engine.handle('START 15'), ['OK'])
+        self.assertEqual(self.engine.handle('BEGIN'), ['7,7'])
+        self.engine.handle('TURN 8,7')
+        self.assertEqual(self.engine.ai.board[7][8], self.engine.ai.PLAYER)
+        self.assertEqual(self.engine.ai.board_copy().move_count, 3)
+        self.assertEqual(self.engine.handle('TURN 8,7'), ['ERROR invalid move'])
+        self.assertEqual(self.engine.handle('TAKEBACK 8,7'), ['OK'])
+        self.assertTrue(self.engine.ai.is_valid_move(7, 8))
+
+    def test_ponder(self):
+        engine = PiskvorkEngine(ponder = True)
+        engine.handle('INFO timeout_turn 200')
+        engine.handle('START 15')
+        engine.handle('BEGIN')
+        self.assertTrue(engine.ai.pondering)
+        self.assertEqual(len(engine.handle('TURN 8,7')), 1)
+        engine.handle('END')
+        self.assertFalse(engine.ai.pondering)
+
+    def test_board(self):
+        self.engine.handle('RECTSTART 20,15')
+        self.assertEqual(self.engine.ai.board.shape, (15, 20))
+        for line in ['BOARD', '3,5,2', '4,5,2', '5,5,2', '6,5,2', '10,10,1']:
+            self.assertEqual(self.engine.handle(line), [])
+        # the opponent's four is blocked
+        self.assertIn(self.engine.handle('DONE')[0], ['2,5', '7,5'])
+
+    def test_info_limits(self):
+        self.engine.handle('INFO timeout_turn 1000')
+        self.engine.handle('INFO timeout_match 60000')
+        self.engine.handle('INFO time_left 4000')
+        self.assertEqual(self.engine.time_limit_ms(), 4000 / PiskvorkEngine.MOVES_LEFT - PiskvorkEngine.MARGIN_MS)
+        self.engine.handle('INFO max_memory 8388608')
+        self.assertEqual(self.engine.tt_memory_mb(), 4)
+
+    def test_fastest(self):
+        # timeout_turn 0 is "as fast as possible"
+        self.engine.handle('INFO timeout_turn 0')
+        self.assertEqual(self.engine.time_limit_ms(), PiskvorkEngine.FASTEST_MS)
+        self.engine.handle('START 15')
+        start = time.perf_counter()
+        self.assertEqual(len(self.engine.handle('TURN 7,7')), 1)
+        self.assertLess(time.perf_counter() - start, 2)
+        # no limit at all (a negative timeout_turn): a search to a fixed depth
+        self.engine.handle('INFO timeout_turn -1')
+        self.assertIsNone(self.engine.time_limit_ms())
+        self.assertEqual(len(self.engine.handle('TURN 9,9')), 1)
+        self.assertEqual(self.engine.ai.completed_depth, PiskvorkEngine.DEPTH)
+
+    def test_full_board(self):
+        # a full 5x5 board without a five
+        stones = [0, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1, 1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 1, 0, 0, 0]
+        self.engine.handle('INFO timeout_turn 200')
+        self.engine.handle('START 5')
+        self.engine.handle('BOARD')
+        for cell, player in enumerate(stones):
+            self.engine.handle(f"{cell % 5},{cell // 5},{1 if player == self.engine.ai.COMPUTER else 2}")
+        answer = self.engine.handle('DONE')
+        self.assertEqual(len(answer), 1)
+        self.assertTrue(answer[0].startswith('ERROR'))
+
+    def test_run(self):
+        output = io.StringIO()
+        self.engine.run(io.StringIO('START 15\nABOUT\nSWAP2BOARD\nEND\nSTART 15\n'), output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'OK')
+        self.assertTrue(lines[1].startswith('name='))
+        self.assertTrue(lines[2].startswith('UNKNOWN'))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(self.engine.ended)
+
+class TestParallelSearch(unittest.TestCase):
+    def setUp(self):
+        self.ai = AI()
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0), (6, 6, 1), (9, 9, 0)]:
+            self.ai.add_move(row, col, player)
+
+    def tearDown(self):
+        self.ai.close()
+
+    def test_same_move_as_serial(self):
+        serial = AI(board = self.ai.board_copy())
+        _, move = serial.minimax(2, serial.COMPUTER, float('-inf'), float('inf'), True, serial.last_move)
+        self.assertEqual(self.ai.parallel_move(2, workers = 2), move)
+        self.assertEqual(self.ai.board[7][7], 0)
+        # positions with tied root moves, the order of the root decides between them
+        for name in benchmark.POSITIONS:
+            for depth in range(1, 4):
+                serial = benchmark.load_ai(name)
+                _, move = serial.minimax(depth, serial.COMPUTER, float('-inf'), float('inf'), True, serial.last_move)
+                parallel = benchmark.load_ai(name)
+                try:
+                    self.assertEqual(parallel.parallel_move(depth, workers = 2), move, (name, depth))
+                finally:
+                    parallel.close()
+
+    def test_speedup_report(self):
+        report = speedup_report(self.ai, 1, (2,))
+        self.assertEqual([row['mode'] for row in report], ['serial', 'parallel'])
+        self.assertTrue(all(row['same_move'] for row in report))
+
+class TestArena(unittest.TestCase):
+    def test_create_engine(self):
+        self.assertIsInstance(create_engine('mcts:playouts=50'), MctsEngine)
+        self.assertIsInstance(create_engine('pbrain:timeout_turn=100'), ProtocolEngine)
+        self.assertIsInstance(create_engine('minimax:depth=2,time_limit_ms=None'), MinimaxEngine)
+        self.assertRaises(ValueError, create_engine, 'unknown')
+
+    def test_play_game(self):
+        result = play_game(0, 'minimax:depth=1', 'heuristic')
+        self.assertIn(result['winner'], (0, 1, None))
+        self.assertEqual(result['move_count'], len(result['moves']))
+        self.assertEqual(len(result['latency_ms'][0]) + len(result['latency_ms'][1]), result['move_count'])
+
+    def test_play_game_protocol(self):
+        result = play_game(0, 'pbrain:timeout_turn=100', 'heuristic')
+        self.assertNotEqual(result['reason'], 'illegal move')
+        self.assertGreater(result['move_count'], 0)
+
+    def test_play_game_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.jsonl')
+            result = play_game(0, 'minimax:depth=1', 'heuristic', trace = path)
+            records = load(path)
+        self.assertIsNone(result['search'][1])
+        self.assertEqual(result['search'][0]['searches'], len(result['latency_ms'][0]))
+        self.assertEqual(len(records), len(result['latency_ms'][0]))
+        self.assertEqual(records[0]['engine'], 'minimax:depth=1')
+
+    def test_elo_difference(self):
+        self.assertAlmostEqual(elo_difference(0.5), 0)
+        self.assertGreater(elo_difference(0.75), 0)
+
+    def test_run(self):
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            arena = Arena('minimax:depth=1', 'heuristic', games = 2, workers = 1)
+            summary = arena.run(on_result = results.append, records = directory)
+            recorded = [game for _, game in RecordReader(directory).games()]
+        self.assertEqual([game['moves'] for game in recorded], [result['moves'] for result in results])
+        self.assertEqual(summary['games'], 2)
+        self.assertEqual(summary['a_wins'] + summary['b_wins'] + summary['draws'], 2)
+        self.assertEqual(sorted(result['first'] for result in results), ['heuristic', 'minimax:depth=1'])
+
+class TestBenchmark(unittest.TestCase):
+    def test_positions(self):
+        for name in benchmark.POSITIONS:
+            ai = benchmark.load_ai(name)
+            self.assertFalse(ai.is_winner(ai.PLAYER, 'minmax'))
+            self.assertFalse(ai.is_winner(ai.COMPUTER, 'minmax'))
+
+    def test_measure(self):
+        result = benchmark.measure('opening_diagonal', 'minimax', 2)
+        self.assertGreater(result['nodes'], 0)
+        self.assertGreater(result['nodes_per_second'], 0)
+        self.assertIsNotNone(result['peak_memory_kb'])
+        self.assertEqual(benchmark.measure('tactical_block_four', 'search_blocking_move', 1, False)['result'], True)
+
+    def test_board_sizes(self):
+        results = benchmark.run_suite(['midgame_cluster'], ['minimax'], {'minimax': 2}, False, sizes = (15, 30))
+        # the same position in the middle of a bigger board is the same search
+        self.assertEqual([result['size'] for result in results], [15, 30])
+        self.assertEqual(results[0]['nodes'], results[1]['nodes'])
+
+    def test_compare(self):
+        results = benchmark.run_suite(['opening_center'], ['generate_moves'], {'generate_moves': 10}, False)
+        slower = [dict(result, nodes_per_second = result['nodes_per_second'] / 2) for result in results]
+        self.assertEqual(benchmark.compare(results, results), [])
+        self.assertEqual(len(benchmark.compare(slower, results)), 1)
+
+class TestBackgroundSearch(unittest.TestCase):
+    def test_result(self):
+        search = BackgroundSearch(lambda: 42)
+        self.assertEqual(search.result(), 42)
+        self.assertTrue(search.done)
+        self.assertFalse(search.cancelled)
+
+    def test_cancel(self):
+        ai = AI()
+        for row, col, player in [(7, 7, 0), (7, 8, 1), (8, 8, 0)]:
+            ai.add_move(row, col, player)
+        board = ai.board.copy()
+        search = BackgroundSearch(lambda: ai.computer_move(None), ai.stop)
+        search.cancel()
+        self.assertTrue(search.done)
+        self.assertTrue(search.cancelled)
+        np.testing.assert_array_equal(ai.board, board)
+
+    def test_error(self):
+        search = BackgroundSearch(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, search.result)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,28 +1,34 @@
 from services.game import Game
 from ui.components.button import Button
 import sys
+import numpy as np
 import pygame
 import pygame.gfxdraw # for drawing anti-aliased shapes
 from services.ai import AI
+from services.background import BackgroundSearch
 
 class GUI:
-    def __init__(self):
-        self.__game = Game()
-        self.__ai = AI()
+    def __init__(self, height = 15, width = 15):
+        self.BOARD_HEIGHT = height
+        self.BOARD_WIDTH = width
+        self.__game = Game(height, width)
+        self.__ai = AI(height = height, width = width)
         self.BACKGROUND_IMAGE = pygame.image.load("../src/static/images/background.jpeg")
         self.WHITE = (255, 255, 255)
         self.BLACK = (0, 0, 0)
         self.RED = (200, 0, 0)
         self.BLUE = (0, 0, 200)
-        self.CELL_SIZE = 40
-        self.BOARD_SIZE = 15
+        self.CELL_SIZE = min(40, 600 // max(height, width)) # a big board gets smaller cells, not a bigger window
         self.play_ai_button = None
         self.play_computer_button = None
         self.__version = "computer"
-        self.WIDTH, self.HEIGHT = self.CELL_SIZE * (self.BOARD_SIZE), self.CELL_SIZE * (self.BOARD_SIZE)
+        self.WIDTH, self.HEIGHT = self.CELL_SIZE * self.BOARD_WIDTH, self.CELL_SIZE * self.BOARD_HEIGHT
         self.window_size = (700, 700)
         self.__screen = pygame.display.set_mode(self.window_size)
         self.board_pos = ((self.window_size[0] - self.WIDTH) // 2, (self.window_size[1] - self.HEIGHT) // 2)
+        self.__board_surface = None
+        self.__stone_sprites = None
+        self.__drawn = None # what the screen shows of the board, None when it has to be redrawn whole
         self.init_window()
     
     def init_window(self):
@@ -33,93 +39,70 @@ class GUI:
         
     def clear_screen(self):
         self.__screen.blit(self.BACKGROUND_IMAGE, (-100, -100))
+        self.__drawn = None
+
+    def build_surfaces(self):
+        '''
+        Renders, once, the background with the grid and a sprite for the stones of each player
+        '''
+        self.__board_surface = pygame.Surface(self.window_size).convert()
+        self.__board_surface.blit(self.BACKGROUND_IMAGE, (-100, -100))
+        for row in range(self.BOARD_HEIGHT):
+            for col in range(self.BOARD_WIDTH):
+                pygame.draw.rect(self.__board_surface, self.WHITE, self.cell_rect(row, col), 1)
+
+        self.__stone_sprites = {}
+        for player, color in ((0, self.RED), (1, self.BLUE)):
+            sprite = pygame.Surface((self.CELL_SIZE, self.CELL_SIZE), pygame.SRCALPHA)
+            pygame.gfxdraw.filled_circle(sprite, self.CELL_SIZE // 2, self.CELL_SIZE // 2, self.CELL_SIZE // 2 - 2, color)
+            pygame.gfxdraw.aacircle(sprite, self.CELL_SIZE // 2, self.CELL_SIZE // 2, self.CELL_SIZE // 2 - 2, color)
+            self.__stone_sprites[player] = sprite
+
+    def cell_rect(self, row, col):
+        return pygame.Rect(
+                            self.board_pos[0] + col * self.CELL_SIZE, 
+                            self.board_pos[1] + row * self.CELL_SIZE, 
+                            self.CELL_SIZE, 
+                            self.CELL_SIZE
+                            )
+
+    def draw_cell(self, row, col, value):
+        '''
+        Draws one cell from the cached surfaces
+        :return: the rectangle that was drawn
+        '''
+        rect = self.cell_rect(row, col)
+        self.__screen.blit(self.__board_surface, rect, rect)
+        if value in self.__stone_sprites:
+            self.__screen.blit(self.__stone_sprites[value], rect)
+        return rect
 
     def display_board(self):
-        self.clear_screen()
-        for row in range(self.BOARD_SIZE):
-            for col in range(self.BOARD_SIZE):
-                pygame.draw.rect(
-                                self.__screen, 
-                                self.WHITE, 
-                                (
-                                    self.board_pos[0] + col * self.CELL_SIZE, 
-                                    self.board_pos[1] + row * self.CELL_SIZE, 
-                                    self.CELL_SIZE, 
-                                    self.CELL_SIZE
-                                ), 
-                                1
-                                )
+        '''
+        Draws the board. Only the cells that changed since the last call are redrawn (and sent to the display),
+        unless the screen was cleared in between.
+        '''
+        if self.__board_surface is None:
+            self.build_surfaces()
+        board = self.__game.board if self.__version == "computer" else self.__ai.board
 
-        for row in range(self.BOARD_SIZE):
-            for col in range(self.BOARD_SIZE):
-                if self.__version == "computer":
-                    if self.__game.board[row][col] == 0:
-                        pygame.gfxdraw.filled_circle(
-                                                    self.__screen, 
-                                                    self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.CELL_SIZE // 2 - 2, 
-                                                    self.RED
-                                                    )
-                        pygame.gfxdraw.aacircle(
-                                                    self.__screen, 
-                                                    self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.CELL_SIZE // 2 - 2, 
-                                                    self.RED
-                                                )
-                    elif self.__game.board[row][col] == 1:
-                        pygame.gfxdraw.filled_circle(
-                                                    self.__screen, 
-                                                    self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                    self.CELL_SIZE // 2 - 2, 
-                                                    self.BLUE
-                                                    )
-                        pygame.gfxdraw.aacircle(
-                                                self.__screen, 
-                                                self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.CELL_SIZE // 2 - 2, 
-                                                self.BLUE
-                                                )
-                        
-                else:
-                    if self.__ai.board[row][col] == 0:
-                        pygame.gfxdraw.filled_circle(
-                                                self.__screen, 
-                                                self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.CELL_SIZE // 2 - 2, 
-                                                self.RED)
-                        pygame.gfxdraw.aacircle(
-                                                self.__screen, 
-                                                self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.CELL_SIZE // 2 - 2, 
-                                                self.RED
-                                                )
-                    elif self.__ai.board[row][col] == 1:
-                        pygame.gfxdraw.filled_circle(
-                                                    self.__screen, 
-                                                     self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                     self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                     self.CELL_SIZE // 2 - 2, self.BLUE
-                                                    )
-                        pygame.gfxdraw.aacircle(
-                                                self.__screen, 
-                                                self.board_pos[0] + col * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.board_pos[1] + row * self.CELL_SIZE + self.CELL_SIZE // 2, 
-                                                self.CELL_SIZE // 2 - 2, self.BLUE
-                                                )
-                        
-        pygame.display.flip()
+        if self.__drawn is None or self.__drawn.shape != board.shape:
+            self.__screen.blit(self.__board_surface, (0, 0))
+            for row, col in np.argwhere(board != -1):
+                self.draw_cell(row, col, board[row][col])
+            pygame.display.flip()
+        else:
+            rects = [self.draw_cell(row, col, board[row][col]) for row, col in np.argwhere(board != self.__drawn)]
+            if rects:
+                pygame.display.update(rects)
+
+        self.__drawn = board.copy()
         
     def display_start_menu(self):
         font = pygame.font.Font(None, 40)
         self.clear_screen()
-        self.__game = Game()
-        self.__ai = AI()
+        self.__game = Game(self.BOARD_HEIGHT, self.BOARD_WIDTH)
+        self.__ai = AI(height = self.BOARD_HEIGHT, width = self.BOARD_WIDTH)
 
         welcome_text = font.render('Welcome to Gomoku', True, self.WHITE)
         play_computer_text = font.render('Play against Computer', True, self.WHITE)
@@ -224,10 +207,37 @@ class GUI:
                         return
             
     def get_clicked_cell(self, pos):
-        row = pos[1] // self.CELL_SIZE - 1
-        col = pos[0] // self.CELL_SIZE - 1
+        row = (pos[1] - self.board_pos[1]) // self.CELL_SIZE
+        col = (pos[0] - self.board_pos[0]) // self.CELL_SIZE
         return row, col
     
+    def undo_turn(self, game):
+        '''
+        Takes back the moves up to the player's last one, so it is the player's turn again
+        :param game: the Game or the AI the moves are taken back on
+        '''
+        while game.undo_move() is not None and game.player != 0:
+            pass
+        self.display_board()
+
+    def redo_turn(self, game):
+        '''
+        Plays again the moves taken back, up to the player's next turn
+        :param game: the Game or the AI the moves are played again on
+        '''
+        while game.redo_move() is not None and game.player != 0 and not game.game_over:
+            pass
+        self.display_board()
+
+    def handle_history_key(self, event, game):
+        '''
+        'u' takes back the last turn, 'r' plays it again
+        '''
+        if event.key == pygame.K_u:
+            self.undo_turn(game)
+        elif event.key == pygame.K_r:
+            self.redo_turn(game)
+
     def play_with_computer(self):
         self.__version = "computer"
         self.display_board()
@@ -236,6 +246,8 @@ class GUI:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     sys.exit()
+                elif event.type == pygame.KEYDOWN:
+                    self.handle_history_key(event, self.__game)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     pos = pygame.mouse.get_pos()
                     row, col = self.get_clicked_cell(pos)
@@ -253,6 +265,69 @@ class GUI:
                         self.display_board()
         self.display_winner()
         
+    def ai_search(self):
+        '''
+        The whole think of the AI: a win, a block or a forced win by fours, else the minimax move.
+        Runs in a background thread.
+        :return: the row and column of the move
+        '''
+        move = self.__ai.tactical_move()
+        if move is None:
+            move = self.__ai.computer_move()
+        return move
+
+    def display_thinking(self):
+        '''
+        Shows the progress of the AI's search under the board
+        '''
+        font = pygame.font.Font(None, 30)
+        text = font.render(
+                            f"AI is thinking...  depth {self.__ai.completed_depth}, {self.__ai.nodes} nodes", 
+                            True, 
+                            self.WHITE
+                            )
+        area = self.clear_thinking(update = False)
+        self.__screen.blit(text, ((self.window_size[0] - text.get_width()) // 2, area.y + 10))
+        pygame.display.update(area)
+
+    def clear_thinking(self, update = True):
+        '''
+        Puts the background back under the board, where display_thinking writes
+        :param update: whether to show it right away
+        :return: the area under the board
+        '''
+        area = pygame.Rect(0, self.window_size[1] - 40, self.window_size[0], 40)
+        self.__screen.blit(self.BACKGROUND_IMAGE, area, area.move(100, 100))
+        if update:
+            pygame.display.update(area)
+        return area
+
+    def wait_for_ai(self):
+        '''
+        Runs the AI's search in the background and keeps the window alive while it thinks.
+        Closing the window or pressing Escape (back to the menu) abandons the search.
+        :return: the row and column of the AI's move, None if the search was abandoned
+        '''
+        search = BackgroundSearch(self.ai_search, self.__ai.stop)
+        clock = pygame.time.Clock()
+
+        while not search.done:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    search.cancel()
+                    pygame.quit()
+                    sys.exit()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    search.cancel()
+                    self.clear_thinking()
+                    return None
+            self.display_thinking()
+            clock.tick(30)
+
+        # display_board only redraws the board, the text would stay under it
+        self.clear_thinking()
+        return search.result()
+
     def play_with_ai(self):
         self.__version = "ai"
         self.display_board()
@@ -261,23 +336,34 @@ class GUI:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     sys.exit()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    self.__ai.stop_pondering()
+                    self.display_start_menu()
+                    return
+                elif event.type == pygame.KEYDOWN:
+                    self.__ai.stop_pondering()
+                    self.handle_history_key(event, self.__ai)
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     pos = pygame.mouse.get_pos()
                     row, col = self.get_clicked_cell(pos)
                     if self.__ai.is_valid_move(row, col):
+                        # the real move is in, the search of the predicted ones ends
+                        self.__ai.stop_pondering()
                         self.__ai.add_move(row, col, 0)
                         if not self.__ai.is_winner(0):
                             self.__ai.change_player()
                         self.display_board()
                         if not self.__ai.game_over:
-                            row, col = self.__ai.search_winning_move()
-                            if row is None or col is None:
-                                row, col = self.__ai.search_blocking_move()
-                                if row is None or col is None:
-                                    row, col = self.__ai.computer_move()
+                            move = self.wait_for_ai()
+                            if move is None:
+                                self.display_start_menu()
+                                return
+                            row, col = move
                             self.__ai.add_move(row, col, 1)
                             if not self.__ai.is_winner(1):
                                 self.__ai.change_player()
+                                # think on the player's time
+                                self.__ai.ponder()
                             self.display_board()
         self.display_winner()
     
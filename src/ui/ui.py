@@ -7,9 +7,9 @@ from tabulate import tabulate
 from colorama import Fore
 
 class UI:
-    def __init__(self):
-        self.__game = Game()
-        self.__ai = AI()
+    def __init__(self, height = 15, width = 15):
+        self.__game = Game(height, width)
+        self.__ai = AI(height = height, width = width)
         self.__is_ai = False
         self.__red_circle = "\033[91m\u2B24\033[0m"
         self.__blue_circle = "\033[94m\u2B24\033[0m"
@@ -56,10 +56,34 @@ class UI:
         input("\nPress enter to continue... ")
         self.clear_console()
             
+    def history_command(self, input_str, game):
+        '''
+        Runs "u" (take back the last turn) or "r" (play it again)
+        :param game: the Game or the AI the moves are taken back on
+        :return: True if the input was one of them, False otherwise
+        '''
+        command = input_str.strip().lower()
+        if command == 'u':
+            while game.undo_move() is not None and game.player != 0:
+                pass
+        elif command == 'r':
+            while game.redo_move() is not None and game.player != 0 and not game.game_over:
+                pass
+        else:
+            return False
+        return True
+
     def player_turn_ai(self):
         self.clear_console()
         self.print_board(self.__ai.board)
-        input_str = input(f"{Fore.GREEN}Your turn {self.__blue_circle}  Enter two integers (1-15, 1-15): ")
+        # the AI thinks on the player's time, until the answer is typed in
+        self.__ai.ponder()
+        input_str = input(f"{Fore.GREEN}Your turn {self.__blue_circle}  Enter two integers (1-{self.__game.board_height}, 1-{self.__game.board_width}), u to undo or r to redo: ")
+        self.__ai.stop_pondering()
+        if self.history_command(input_str, self.__ai):
+            if not self.__ai.game_over:
+                self.player_turn_ai()
+            return
         match = self.__input_pattern.match(input_str)
         if match:
             row, column = map(int, match.groups())
@@ -75,7 +99,11 @@ class UI:
     def player_turn_computer(self):
         self.clear_console()
         self.print_board()
-        input_str = input(f"{Fore.GREEN}Your turn {self.__blue_circle}  Enter two integers (1-15, 1-15): ")
+        input_str = input(f"{Fore.GREEN}Your turn {self.__blue_circle}  Enter two integers (1-{self.__game.board_height}, 1-{self.__game.board_width}), u to undo or r to redo: ")
+        if self.history_command(input_str, self.__game):
+            if not self.__game.game_over:
+                self.player_turn_computer()
+            return
         match = self.__input_pattern.match(input_str)
         if match:
             row, column = map(int, match.groups())
@@ -103,7 +131,7 @@ class UI:
         
     def ai_turn(self):
         self.clear_console()
-        row, column = self.__ai.computer_move()
+        row, column = self.__ai.tactical_move() or self.__ai.computer_move()
         self.__ai.add_move(row, column, 1)
         self.__ai.is_winner(1)
         self.print_board(self.__ai.board)